@@ -0,0 +1,94 @@
+import random
+
+from GameModel import GameModel
+from GameSearch import SearchEngine
+from GameMCTS import MonteCarloTreeSearch
+from GameTransposition import TranspositionTable
+
+
+class Agent:
+    name = None
+
+    def __init__(self, gameModel: GameModel, seed=None):
+        self.gameModel = gameModel
+        self.random = random.Random(seed)
+
+    def choose_move(self):
+        # returns (start, end) cell indices of the bitboard or None when there is no legal move
+        raise NotImplementedError
+
+
+class RandomAgent(Agent):
+    name = "random"
+
+    def choose_move(self):
+        moves = list(self.gameModel.bitboard.legal_moves(self.gameModel.activePlayer.color.value))
+        if not moves:
+            return None
+        return self.random.choice(moves)
+
+
+class GreedyAgent(Agent):
+    name = "greedy"
+
+    def __init__(self, gameModel: GameModel, seed=None):
+        super().__init__(gameModel, seed)
+        self.engine = SearchEngine(gameModel.bitboard, gameModel.throne_cells())
+
+    def choose_move(self):
+        bitboard = self.gameModel.bitboard
+        color = self.gameModel.activePlayer.color.value
+        throne = self.engine.thrones[color]
+        bestMoves = []
+        bestScore = None
+        for start, end in bitboard.legal_moves(color):
+            if end == throne:
+                return start, end
+            captured = bitboard.move(color, start, end)
+            score = self.engine.evaluate(color)
+            bitboard.unmake(color, start, end, captured)
+            if bestScore is None or score > bestScore:
+                bestScore = score
+                bestMoves = [(start, end)]
+            elif score == bestScore:
+                bestMoves.append((start, end))
+        if not bestMoves:
+            return None
+        return self.random.choice(bestMoves)
+
+
+class SearchAgent(Agent):
+    name = "search"
+    tableMegabytes = 4
+
+    def __init__(self, gameModel: GameModel, seed=None, depth: int = 2, timeBudget: float = 60.0):
+        super().__init__(gameModel, seed)
+        self.engine = SearchEngine(gameModel.bitboard, gameModel.throne_cells(), timeBudget, depth,
+                                   table=TranspositionTable(self.tableMegabytes))
+
+    def choose_move(self):
+        return self.engine.search(self.gameModel.activePlayer.color.value)
+
+
+class MonteCarloAgent(Agent):
+    name = "mcts"
+
+    def __init__(self, gameModel: GameModel, seed=None, iterations: int = 1000):
+        super().__init__(gameModel, seed)
+        self.engine = MonteCarloTreeSearch(gameModel.bitboard, gameModel.throne_cells(), iterations=iterations,
+                                           seed=seed)
+
+    def choose_move(self):
+        return self.engine.search(self.gameModel.activePlayer.color.value)
+
+
+agentTypes = {agentType.name: agentType for agentType in (RandomAgent, GreedyAgent, SearchAgent, MonteCarloAgent)}
+
+
+def create_agent(spec: str, gameModel: GameModel, seed=None) -> Agent:
+    # spec is an agent name followed by optional numeric arguments, e.g. "random" or "search:3" or "mcts:2000"
+    name, *arguments = spec.split(":")
+    if name not in agentTypes:
+        raise ValueError("Unknown agent {}, expected one of {}".format(name, ", ".join(agentTypes)))
+    return agentTypes[name](gameModel, seed, *(float(argument) if "." in argument else int(argument)
+                                               for argument in arguments))
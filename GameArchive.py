@@ -0,0 +1,117 @@
+import mmap
+import sqlite3
+import struct
+
+from GameLayout import BoardLayout
+from GameModel import GameModel
+from GameRecord import GameRecord, GameRecordError
+
+
+class GameArchive:
+    # games are appended to <path>.games as a result byte followed by a GameRecord of the final position,
+    # <path>.index is an SQLite index from position hashes (side to move included) to games
+    recordsSuffix = ".games"
+    indexSuffix = ".index"
+    result = struct.Struct("<b")
+
+    def __init__(self, path: str, layout: BoardLayout = None):
+        # all games of an archive are played on one board, the default one unless layout is given
+        self.recordsPath = path + self.recordsSuffix
+        self.records = open(self.recordsPath, "ab")
+        self.index = sqlite3.connect(path + self.indexSuffix)
+        self.index.executescript("""
+            PRAGMA journal_mode = WAL;
+            PRAGMA synchronous = NORMAL;
+            CREATE TABLE IF NOT EXISTS games (id INTEGER PRIMARY KEY, offset INTEGER, winner INTEGER, plies INTEGER);
+            CREATE TABLE IF NOT EXISTS positions (hash INTEGER, game INTEGER, ply INTEGER, move INTEGER);
+            CREATE INDEX IF NOT EXISTS positionsByHash ON positions (hash);
+        """)
+        self.gameModel = GameModel(layout)
+        self.initialState = self.gameModel.bitboard.state()
+        self.initialColor = self.gameModel.activePlayer.color.value
+        bitboard = self.gameModel.bitboard
+        self.thrones = (bitboard.cell(self.gameModel.player1ThronePos), bitboard.cell(self.gameModel.player2ThronePos))
+
+    def close(self):
+        self.records.close()
+        self.index.close()
+
+    @classmethod
+    def signed(cls, positionHash: int) -> int:
+        # SQLite integers are signed 64-bit
+        return positionHash - (1 << 64) if positionHash >= 1 << 63 else positionHash
+
+    def position_key(self, gameModel: GameModel) -> int:
+        return self.signed(gameModel.bitboard.position_hash(gameModel.activePlayer.color.value))
+
+    def replay(self, history: list):
+        # yields (hash, ply, move) of every position before a move, moves encoded as start * cells + end
+        bitboard = self.gameModel.bitboard
+        bitboard.set_state(self.initialState)
+        numOfBits = bitboard.numOfBits
+        color = self.initialColor
+        for ply, (start, end) in enumerate(history):
+            yield self.signed(bitboard.position_hash(color)), ply, start * numOfBits + end
+            bitboard.move(color, start, end)
+            color = 1 - color
+
+    def add_games(self, games) -> int:
+        # games is an iterable of (history, winner) with winner a color value or -1; returns the number added
+        added = 0
+        with self.index:
+            cursor = self.index.cursor()
+            for history, winner in games:
+                positions = list(self.replay(history))
+                finalColor = self.initialColor ^ (len(history) & 1)
+                record = GameRecord(self.gameModel.numOfCells, tuple(self.gameModel.bitboard.stones), finalColor,
+                                    self.gameModel.player1.color.value, self.thrones, list(history))
+                buffer = bytearray(self.result.size + record.size())
+                self.result.pack_into(buffer, 0, winner)
+                record.pack_into(buffer, self.result.size)
+                offset = self.records.tell()
+                self.records.write(buffer)
+                cursor.execute("INSERT INTO games (offset, winner, plies) VALUES (?, ?, ?)", (offset, winner, len(history)))
+                gameId = cursor.lastrowid
+                cursor.executemany("INSERT INTO positions VALUES (?, ?, ?, ?)",
+                                   [(positionHash, gameId, ply, move) for positionHash, ply, move in positions])
+                added += 1
+        self.records.flush()
+        return added
+
+    def add_game(self, history: list, winner: int) -> int:
+        return self.add_games([(history, winner)])
+
+    def read_game(self, gameId: int) -> tuple:
+        row = self.index.execute("SELECT offset, winner FROM games WHERE id = ?", (gameId,)).fetchone()
+        if row is None:
+            raise GameRecordError("No game {} in the archive".format(gameId))
+        self.records.flush()
+        with open(self.recordsPath, "rb") as file:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                record = GameRecord.unpack_from(buffer, row[0] + self.result.size)[0]
+        return record, row[1]
+
+    def games_with_position(self, positionHash: int) -> list:
+        return self.index.execute("SELECT game, ply FROM positions WHERE hash = ? ORDER BY game",
+                                  (positionHash,)).fetchall()
+
+    def position_stats(self, positionHash: int) -> dict:
+        stats = {"games": 0, "wins": [0, 0], "undecided": 0}
+        rows = self.index.execute("SELECT games.winner, COUNT(*) FROM positions JOIN games ON games.id = positions.game "
+                                  "WHERE positions.hash = ? GROUP BY games.winner", (positionHash,))
+        for winner, count in rows:
+            stats["games"] += count
+            if winner < 0:
+                stats["undecided"] += count
+            else:
+                stats["wins"][winner] += count
+        return stats
+
+    def book_moves(self, positionHash: int, color: int) -> list:
+        # (move, games, wins of color) played from this position, most played first
+        return self.index.execute("SELECT positions.move, COUNT(*), SUM(games.winner = ?) FROM positions "
+                                  "JOIN games ON games.id = positions.game WHERE positions.hash = ? "
+                                  "GROUP BY positions.move ORDER BY COUNT(*) DESC", (color, positionHash)).fetchall()
+
+    def num_of_games(self) -> int:
+        return self.index.execute("SELECT COUNT(*) FROM games").fetchone()[0]
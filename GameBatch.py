@@ -0,0 +1,140 @@
+import numpy as np
+
+from GameModel import GameModel
+
+
+class BatchGameModel:
+    # board cells hold 0 for empty or GameColor value + 1
+    # a move is encoded as (startCell * 4 + direction) * maxDistance + distance - 1
+    steps = ((-1, 0), (1, 0), (0, -1), (0, 1))
+
+    def __init__(self, numOfGames: int, gameModel: GameModel = None):
+        if gameModel is None:
+            gameModel = GameModel()
+        n = gameModel.numOfCells
+        self.numOfCells = n
+        self.numOfGames = numOfGames
+        self.maxDistance = n - 1
+        self.wallsMap = gameModel.wallsMap
+
+        self.thrones = np.zeros(2, dtype=np.intp)
+        for player in (gameModel.player1, gameModel.player2):
+            self.thrones[player.color] = player.opponentThrone
+
+        self.targets = None
+        self.staticMask = None
+        self.rays_init(gameModel)
+
+        position = np.zeros(n * n, dtype=np.uint8)
+        for player in (gameModel.player1, gameModel.player2):
+            position[list(player.balls)] = player.color + 1
+        self.board = np.repeat(position.reshape(n, n)[np.newaxis], numOfGames, axis=0)
+        self.active = np.full(numOfGames, gameModel.activePlayer.color, dtype=np.uint8)
+        self.counts = np.zeros((numOfGames, 2), dtype=np.int16)
+        for player in (gameModel.player1, gameModel.player2):
+            self.counts[:, player.color] = len(player.balls)
+        self.winners = np.full(numOfGames, -1, dtype=np.int8)
+        self.plies = np.zeros(numOfGames, dtype=np.int32)
+
+    def rays_init(self, gameModel: GameModel):
+        # targets[cell, direction, distance - 1] is the cell reached by that slide,
+        # staticMask tells whether walls and thrones allow it on an empty board
+        n = self.numOfCells
+        walls = gameModel.wallsMap
+        thrones = {gameModel.player1ThronePos, gameModel.player2ThronePos}
+        self.targets = np.zeros((n * n, 4, self.maxDistance), dtype=np.intp)
+        self.staticMask = np.zeros((n * n, 4, self.maxDistance), dtype=bool)
+        for cell in range(n * n):
+            row, column = divmod(cell, n)
+            startWall = walls[row, column]
+            for direction, (dy, dx) in enumerate(self.steps):
+                for distance in range(1, n):
+                    y, x = row + dy * distance, column + dx * distance
+                    if not (0 <= y < n and 0 <= x < n):
+                        break
+                    self.targets[cell, direction, distance - 1] = y * n + x
+                    sameTerrain = walls[y, x] == startWall
+                    if sameTerrain or distance == 1:
+                        self.staticMask[cell, direction, distance - 1] = True
+                    if not sameTerrain or (y, x) in thrones:
+                        break
+
+    def encode_move(self, startPos: tuple, endPos: tuple) -> int:
+        dy = endPos[0] - startPos[0]
+        dx = endPos[1] - startPos[1]
+        direction = self.steps.index((int(np.sign(dy)), int(np.sign(dx))))
+        distance = abs(dy) + abs(dx)
+        startCell = startPos[0] * self.numOfCells + startPos[1]
+        return (startCell * 4 + direction) * self.maxDistance + distance - 1
+
+    def decode_move(self, move: int) -> tuple:
+        startCell, rest = divmod(int(move), 4 * self.maxDistance)
+        direction, distance = divmod(rest, self.maxDistance)
+        endCell = int(self.targets[startCell, direction, distance])
+        return divmod(startCell, self.numOfCells), divmod(endCell, self.numOfCells)
+
+    def stone_masks(self) -> tuple:
+        # legal slides of every stone of the side to move: game and cell index of each stone
+        # together with a (stones, 4, maxDistance) mask, so that empty cells are never scanned
+        flat = self.board.reshape(self.numOfGames, -1)
+        ownValue = self.active + 1
+        ownValue[self.winners >= 0] = 0xFF
+        games, cells = np.nonzero(flat == ownValue[:, np.newaxis])
+        rays = flat[games[:, np.newaxis, np.newaxis], self.targets[cells]]
+        empty = rays == 0
+        clearBefore = np.ones_like(empty)
+        clearBefore[..., 1:] = np.logical_and.accumulate(empty[..., :-1], axis=-1)
+        masks = clearBefore & (rays != ownValue[games][:, np.newaxis, np.newaxis])
+        masks &= self.staticMask[cells]
+        return games, cells, masks
+
+    def legal_masks(self) -> np.ndarray:
+        # (numOfGames, cells, 4, maxDistance) bool array of legal slides for the side to move
+        games, cells, stoneMasks = self.stone_masks()
+        masks = np.zeros((self.numOfGames,) + self.targets.shape, dtype=bool)
+        masks[games, cells] = stoneMasks
+        return masks
+
+    def apply_moves(self, moves: np.ndarray):
+        # moves[i] < 0 leaves game i untouched; games that are already won are skipped
+        moves = np.asarray(moves)
+        games = np.nonzero((moves >= 0) & (self.winners < 0))[0]
+        if not len(games):
+            return
+        startCells, rest = np.divmod(moves[games], 4 * self.maxDistance)
+        directions, distances = np.divmod(rest, self.maxDistance)
+        endCells = self.targets[startCells, directions, distances]
+        colors = self.active[games]
+        flat = self.board.reshape(self.numOfGames, -1)
+        captured = flat[games, endCells] == 2 - colors
+        np.subtract.at(self.counts, (games[captured], 1 - colors[captured]), 1)
+        flat[games, startCells] = 0
+        flat[games, endCells] = colors + 1
+        won = endCells == self.thrones[colors]
+        self.winners[games[won]] = colors[won]
+        self.active[games] = 1 - colors
+        self.plies[games] += 1
+
+    def random_moves(self, generator: np.random.Generator) -> np.ndarray:
+        games, cells, masks = self.stone_masks()
+        masks = masks.reshape(len(games), -1)
+        scores = generator.random(masks.shape, dtype=np.float32)
+        scores[~masks] = -1.0
+        stoneMoves = scores.argmax(axis=1)
+        stoneScores = scores[np.arange(len(games)), stoneMoves]
+        bestScores = np.full(self.numOfGames, -1.0, dtype=np.float32)
+        np.maximum.at(bestScores, games, stoneScores)
+        chosen = (stoneScores == bestScores[games]) & (stoneScores >= 0)
+        moves = np.full(self.numOfGames, -1, dtype=np.intp)
+        moves[games[chosen]] = cells[chosen] * masks.shape[1] + stoneMoves[chosen]
+        return moves
+
+    def rollout(self, generator: np.random.Generator, maxPlies: int = 300) -> np.ndarray:
+        for ply in range(maxPlies):
+            if (self.winners >= 0).all():
+                break
+            moves = self.random_moves(generator)
+            if (moves < 0).all():
+                break
+            self.apply_moves(moves)
+        return self.winners
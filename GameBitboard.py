@@ -0,0 +1,262 @@
+import hashlib
+import os
+import random
+
+
+class Bitboard:
+    # cells are indexed row * numOfCells + column, bit i of a mask is cell i
+    NORTH = 0
+    SOUTH = 1
+    WEST = 2
+    EAST = 3
+    positiveDirections = (False, True, False, True)
+    zobristSeed = 0x5EED
+    # slide tables depend only on the layout, they are kept per process and on disk keyed by its hash
+    cacheDir = os.path.join(os.path.split(os.path.abspath(__file__))[0], "resources", "cache")
+    diskCache = True
+    slidesVersion = 1
+    slideTables = {}
+    # numOfCells -> (rays, neighbours), they depend on the size only
+    rayTables = {}
+
+    __slots__ = ("numOfCells", "numOfBits", "fullMask", "positions", "walls", "ground", "thrones", "rays", "neighbours",
+                 "slides", "stones", "zobrist", "sideKeys", "hash")
+
+    def __init__(self, wallsMap, thronePositions, numOfCells: int):
+        self.numOfCells = numOfCells
+        self.numOfBits = numOfCells * numOfCells
+        self.fullMask = (1 << self.numOfBits) - 1
+        self.positions = tuple(divmod(i, numOfCells) for i in range(self.numOfBits))
+
+        self.walls = 0
+        for i, position in enumerate(self.positions):
+            if wallsMap[position]:
+                self.walls |= 1 << i
+        self.ground = self.fullMask ^ self.walls
+        self.thrones = 0
+        for position in thronePositions:
+            self.thrones |= 1 << self.cell(position)
+
+        self.rays = None
+        self.neighbours = None
+        self.rays_init()
+        self.slides = None
+        self.slides_init()
+
+        self.stones = [0, 0]
+
+        self.zobrist = None
+        self.sideKeys = None
+        self.hash = 0
+        self.zobrist_init()
+
+    def rays_init(self):
+        n = self.numOfCells
+        if n in self.rayTables:
+            self.rays, self.neighbours = self.rayTables[n]
+            return
+        steps = ((-1, 0), (1, 0), (0, -1), (0, 1))
+        rays = []
+        neighbours = []
+        for row, column in self.positions:
+            cellRays = []
+            cellNeighbours = 0
+            for dy, dx in steps:
+                ray = 0
+                y, x = row + dy, column + dx
+                if 0 <= y < n and 0 <= x < n:
+                    cellNeighbours |= 1 << (y * n + x)
+                while 0 <= y < n and 0 <= x < n:
+                    ray |= 1 << (y * n + x)
+                    y += dy
+                    x += dx
+                cellRays.append(ray)
+            rays.append(tuple(cellRays))
+            neighbours.append(cellNeighbours)
+        self.rays = tuple(rays)
+        self.neighbours = tuple(neighbours)
+        self.rayTables[n] = self.rays, self.neighbours
+
+    def slides_init(self):
+        # slides[cell][direction] holds the cells a stone on cell can reach in that direction on an empty board:
+        # the same terrain up to and including the first throne, or the adjacent cell of the other terrain
+        layout = self.layout()
+        slides = self.slideTables.get(layout)
+        if slides is None:
+            cachedName = None
+            if self.diskCache:
+                key = hashlib.sha1(bytes([self.slidesVersion]) + self.layout_bytes(layout)).hexdigest()[:16]
+                cachedName = os.path.join(self.cacheDir, "slides-{}.bin".format(key))
+                slides = self.load_slides(cachedName)
+            if slides is None:
+                slides = self.compute_slides()
+                if cachedName is not None:
+                    self.save_slides(slides, cachedName)
+            self.slideTables[layout] = slides
+        self.slides = slides
+
+    def compute_slides(self) -> tuple:
+        slides = []
+        for start, cellRays in enumerate(self.rays):
+            sameTerrain = self.walls if self.walls >> start & 1 else self.ground
+            cellSlides = []
+            for direction, ray in enumerate(cellRays):
+                stops = ray & (self.thrones | (self.fullMask ^ sameTerrain))
+                slide = ray
+                if stops:
+                    if self.positiveDirections[direction]:
+                        stop = (stops & -stops).bit_length() - 1
+                    else:
+                        stop = stops.bit_length() - 1
+                    slide = ray ^ self.rays[stop][direction]
+                    if not sameTerrain >> stop & 1 and not self.neighbours[start] >> stop & 1:
+                        slide ^= 1 << stop
+                cellSlides.append(slide)
+            slides.append(tuple(cellSlides))
+        return tuple(slides)
+
+    def load_slides(self, cachedName: str):
+        # 4 masks of numOfBits bits per cell, little endian
+        width = (self.numOfBits + 7) // 8
+        try:
+            with open(cachedName, "rb") as file:
+                data = file.read()
+        except OSError:
+            return None
+        if len(data) != 4 * width * self.numOfBits:
+            return None
+        masks = [int.from_bytes(data[i:i + width], "little") for i in range(0, len(data), width)]
+        return tuple(tuple(masks[i:i + 4]) for i in range(0, len(masks), 4))
+
+    def save_slides(self, slides: tuple, cachedName: str):
+        width = (self.numOfBits + 7) // 8
+        try:
+            os.makedirs(self.cacheDir, exist_ok=True)
+            with open(cachedName + ".tmp", "wb") as file:
+                file.write(b"".join(mask.to_bytes(width, "little") for cellSlides in slides for mask in cellSlides))
+            os.replace(cachedName + ".tmp", cachedName)
+        except OSError as error:
+            print("Cannot cache slides {}: {}".format(cachedName, error))
+
+    @classmethod
+    def from_layout(cls, layout: tuple):
+        numOfCells, walls, thrones = layout
+        positions = [divmod(i, numOfCells) for i in range(numOfCells * numOfCells)]
+        wallsMap = {position: bool(walls >> i & 1) for i, position in enumerate(positions)}
+        thronePositions = [position for i, position in enumerate(positions) if thrones >> i & 1]
+        return cls(wallsMap, thronePositions, numOfCells)
+
+    def layout(self) -> tuple:
+        return self.numOfCells, self.walls, self.thrones
+
+    @classmethod
+    def layout_bytes(cls, layout: tuple) -> bytes:
+        # what layout hashes are taken of, repr of the masks of a big board passes the 4300 digits limit of int to str
+        numOfCells, walls, thrones = layout
+        size = (numOfCells * numOfCells + 7) // 8
+        return numOfCells.to_bytes(2, "little") + walls.to_bytes(size, "little") + thrones.to_bytes(size, "little")
+
+    def zobrist_init(self):
+        generator = random.Random(self.zobristSeed + self.numOfCells)
+        self.zobrist = tuple(tuple(generator.getrandbits(64) for i in range(self.numOfBits)) for color in range(2))
+        self.sideKeys = (generator.getrandbits(64), generator.getrandbits(64))
+
+    def position_hash(self, color: int) -> int:
+        return self.hash ^ self.sideKeys[color]
+
+    def state(self) -> tuple:
+        return self.stones[0], self.stones[1], self.hash
+
+    def set_state(self, state: tuple):
+        self.stones[0], self.stones[1], self.hash = state
+
+    def cell(self, position: tuple) -> int:
+        return int(position[0]) * self.numOfCells + int(position[1])
+
+    def encode_move(self, start: int, end: int) -> int:
+        # the single int form of a move used by the move stack, the transposition table and the tree search
+        return start * self.numOfBits + end
+
+    def decode_move(self, move: int) -> tuple:
+        return divmod(move, self.numOfBits)
+
+    def place(self, color: int, cell: int):
+        if not self.stones[color] >> cell & 1:
+            self.stones[color] |= 1 << cell
+            self.hash ^= self.zobrist[color][cell]
+
+    def remove(self, color: int, cell: int):
+        if self.stones[color] >> cell & 1:
+            self.stones[color] ^= 1 << cell
+            self.hash ^= self.zobrist[color][cell]
+
+    def move(self, color: int, start: int, end: int) -> bool:
+        endBit = 1 << end
+        keys = self.zobrist[color]
+        captured = self.stones[1 - color] & endBit
+        if captured:
+            self.stones[1 - color] ^= endBit
+            self.hash ^= self.zobrist[1 - color][end]
+        self.stones[color] ^= (1 << start) | endBit
+        self.hash ^= keys[start] ^ keys[end]
+        return bool(captured)
+
+    def unmake(self, color: int, start: int, end: int, captured: bool):
+        endBit = 1 << end
+        keys = self.zobrist[color]
+        self.stones[color] ^= (1 << start) | endBit
+        self.hash ^= keys[start] ^ keys[end]
+        if captured:
+            self.stones[1 - color] |= endBit
+            self.hash ^= self.zobrist[1 - color][end]
+
+    def targets(self, start: int, color: int) -> int:
+        # a slide also stops at the first stone, which is reachable unless it is a friendly one
+        own = self.stones[color]
+        occupied = own | self.stones[1 - color]
+        rays = self.rays
+        targets = 0
+        for direction, slide in enumerate(self.slides[start]):
+            hit = slide & occupied
+            if hit:
+                if self.positiveDirections[direction]:
+                    blocker = (hit & -hit).bit_length() - 1
+                else:
+                    blocker = hit.bit_length() - 1
+                slide &= ~rays[blocker][direction]
+            targets |= slide
+        return targets & ~own
+
+    def direction(self, start: int, end: int) -> int:
+        startRow, startColumn = divmod(start, self.numOfCells)
+        endRow, endColumn = divmod(end, self.numOfCells)
+        if startRow == endRow:
+            if endColumn > startColumn:
+                return self.EAST
+            if endColumn < startColumn:
+                return self.WEST
+        elif startColumn == endColumn:
+            return self.SOUTH if endRow > startRow else self.NORTH
+        return -1
+
+    def valid_move(self, start: int, end: int, color: int) -> bool:
+        direction = self.direction(start, end)
+        if direction < 0:
+            return False
+        endBit = 1 << end
+        if not self.slides[start][direction] & endBit or self.stones[color] & endBit:
+            return False
+        between = self.rays[start][direction] ^ self.rays[end][direction] ^ endBit
+        return not between & (self.stones[0] | self.stones[1])
+
+    def legal_moves(self, color: int):
+        stones = self.stones[color]
+        while stones:
+            startBit = stones & -stones
+            stones ^= startBit
+            start = startBit.bit_length() - 1
+            targets = self.targets(start, color)
+            while targets:
+                endBit = targets & -targets
+                targets ^= endBit
+                yield start, endBit.bit_length() - 1
@@ -0,0 +1,132 @@
+import bisect
+import hashlib
+import mmap
+import os
+import struct
+from array import array
+
+from GameBitboard import Bitboard
+
+
+class OpeningBookError(Exception):
+    pass
+
+
+class OpeningBook:
+    # positions prepared offline by buildbook.py, memory-mapped and searched without loading them;
+    # after the header come columns of count items each: position hashes (side to move included) in ascending
+    # order, moves as start * numOfBits + end, scores, depths and kinds
+    magic = b"CSBK"
+    version = 1
+    header = struct.Struct("<4sBxxx8sI4x")
+    columns = (("keys", "Q"), ("moves", "I"), ("scores", "i"), ("depths", "B"), ("kinds", "B"))
+    # BOOK moves come from a search of depth plies, WIN moves force a win in depth moves of the side to move
+    BOOK = 0
+    WIN = 1
+
+    booksDir = os.path.join(os.path.split(os.path.abspath(__file__))[0], "resources", "books")
+    suffix = ".book"
+    # path -> book or None when missing or unusable, so that a game checks the disk once
+    books = {}
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file = open(path, "rb")
+        try:
+            self.buffer = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self.file.close()
+            raise OpeningBookError("Empty book {}".format(path))
+        if len(self.buffer) < self.header.size:
+            self.close()
+            raise OpeningBookError("Truncated book {}".format(path))
+        magic, version, self.layoutKey, self.count = self.header.unpack_from(self.buffer)
+        if magic != self.magic or version != self.version:
+            self.close()
+            raise OpeningBookError("{} is not a book of version {}".format(path, self.version))
+        size = self.header.size + self.count * sum(struct.calcsize(code) for name, code in self.columns)
+        if len(self.buffer) != size:
+            self.close()
+            raise OpeningBookError("Truncated book {}".format(path))
+        view = memoryview(self.buffer)
+        offset = self.header.size
+        for name, code in self.columns:
+            end = offset + self.count * struct.calcsize(code)
+            setattr(self, name, view[offset:end].cast(code))
+            offset = end
+
+    def close(self):
+        for name, code in self.columns:
+            column = getattr(self, name, None)
+            if column is not None:
+                column.release()
+                setattr(self, name, None)
+        if getattr(self, "buffer", None) is not None:
+            self.buffer.close()
+            self.buffer = None
+        self.file.close()
+
+    @classmethod
+    def layout_key(cls, bitboardLayout: tuple) -> bytes:
+        return hashlib.sha1(Bitboard.layout_bytes(bitboardLayout)).digest()[:8]
+
+    @classmethod
+    def book_path(cls, layout) -> str:
+        return os.path.join(cls.booksDir, layout.name + cls.suffix)
+
+    @classmethod
+    def load(cls, layout, path: str = None):
+        # the book of a BoardLayout or None
+        if path is None:
+            path = cls.book_path(layout)
+        if path not in cls.books:
+            book = None
+            if os.path.exists(path):
+                try:
+                    book = cls(path)
+                except (OSError, OpeningBookError) as error:
+                    print("Warning, cannot use opening book: {}".format(error))
+                else:
+                    if book.layoutKey != cls.layout_key(layout.bitboard_layout()):
+                        print("Warning, opening book {} was built for another board".format(path))
+                        book.close()
+                        book = None
+            cls.books[path] = book
+        return cls.books[path]
+
+    def find(self, key: int) -> int:
+        index = bisect.bisect_left(self.keys, key)
+        if index < self.count and self.keys[index] == key:
+            return index
+        return -1
+
+    def lookup(self, bitboard, color: int):
+        # (start, end, score, depth, kind) for the position or None; moves are checked, a hash collision
+        # must not play an illegal move
+        index = self.find(bitboard.position_hash(color))
+        if index < 0:
+            return None
+        start, end = divmod(self.moves[index], bitboard.numOfBits)
+        if not bitboard.valid_move(start, end, color):
+            return None
+        return start, end, self.scores[index], self.depths[index], self.kinds[index]
+
+    @classmethod
+    def describe(cls, entry: tuple) -> str:
+        start, end, score, depth, kind = entry
+        if kind == cls.WIN:
+            return "win in {}".format(depth)
+        return "book depth {} score {}".format(depth, score)
+
+    @classmethod
+    def write(cls, path: str, layoutKey: bytes, entries: dict):
+        # entries maps position hashes to (move, score, depth, kind)
+        keys = sorted(entries)
+        data = [cls.header.pack(cls.magic, cls.version, layoutKey, len(keys)), array("Q", keys).tobytes()]
+        for i, (name, code) in enumerate(cls.columns[1:]):
+            data.append(array(code, (entries[key][i] for key in keys)).tobytes())
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path + ".tmp", "wb") as file:
+            file.write(b"".join(data))
+        os.replace(path + ".tmp", path)
+        cls.books.pop(path, None)
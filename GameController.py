@@ -1,17 +1,18 @@
-from GameView import *
 from GameMenu import *
-from GameModel import *
+from GameProfiler import FrameProfiler, ProfilerOverlay
+import importlib
 import sys
+import threading
+import time
 
 
-class Gauntlet(pygame.sprite.Sprite):
+class Gauntlet(pygame.sprite.DirtySprite):
     resolution = (60, 60)
 
     def __init__(self):
         super().__init__()
-        self.image = FunContainer.load_image("gauntlet.jpg", -1)
-        self.clickedImage = pygame.transform.scale(self.image, (self.resolution[0]-8, self.resolution[1]-8))
-        self.normalImage = pygame.transform.scale(self.image, self.resolution)
+        self.clickedImage = FunContainer.image("gauntlet.jpg", (self.resolution[0]-8, self.resolution[1]-8), -1)
+        self.normalImage = FunContainer.image("gauntlet.jpg", self.resolution, -1)
         self.image = self.normalImage
         self.rect = self.image.get_rect()
         pygame.mouse.set_visible(False)
@@ -19,166 +20,518 @@ class Gauntlet(pygame.sprite.Sprite):
         self.muted = None
 
     def update(self):
-        self.rect.midtop = pygame.mouse.get_pos()
+        position = pygame.mouse.get_pos()
+        if self.rect.midtop != position:
+            self.rect.midtop = position
+            self.dirty = 1
 
     def clicked(self):
         if not self.muted:
             self.clickedSound.play()
         self.image = self.clickedImage
+        self.dirty = 1
 
     def unclicked(self):
         self.image = self.normalImage
+        self.dirty = 1
+
+
+class ComputerThinker:
+    # runs the search on a background thread; the model must not be changed until the move is taken
+    # a short switch interval lets the render loop take the GIL back from the search every frame
+    switchInterval = 0.001
+    # posted when a move is ready so an idle event loop wakes up
+    moveReady = pygame.USEREVENT
+
+    def __init__(self, gameModel):
+        self.gameModel = gameModel
+        self.thread = None
+        self.engine = None
+        self.move = None
+        self.finished = False
+        self.defaultSwitchInterval = sys.getswitchinterval()
+
+    def start(self):
+        self.move = None
+        self.finished = False
+        # engine.stopped is set by stop() from any thread and only read by the search, so it is cleared here,
+        # before the thread starts, rather than by the search: a stop right after start must not be lost
+        self.engine = self.gameModel.search_engine()
+        self.engine.stopped = False
+        sys.setswitchinterval(self.switchInterval)
+        self.thread = threading.Thread(target=self.think, daemon=True)
+        self.thread.start()
+
+    def think(self):
+        try:
+            self.move = self.gameModel.find_intelligent_move()
+        finally:
+            sys.setswitchinterval(self.defaultSwitchInterval)
+            self.finished = True
+            if pygame.display.get_init():
+                pygame.event.post(pygame.event.Event(self.moveReady))
+
+    def is_thinking(self) -> bool:
+        return self.thread is not None and not self.finished
+
+    def is_ready(self) -> bool:
+        return self.thread is not None and self.finished
+
+    def take_move(self):
+        self.thread.join()
+        self.thread = None
+        if self.gameModel.moveReport is not None:
+            print(self.gameModel.moveReport)
+        return self.move
+
+    def force(self):
+        if self.engine is not None:
+            self.engine.stop()
+
+    def cancel(self):
+        if self.thread is not None:
+            self.engine.stop()
+            self.thread.join()
+            self.thread = None
+
+
+class Scene:
+    # one screen of the game, the controller feeds it events and redraws it once per loop pass
+
+    def __init__(self, controller):
+        self.controller = controller
+        self.gauntlet = controller.gauntlet
+
+    def enter(self):
+        pass
+
+    def leave(self):
+        pass
+
+    def handle_event(self, event):
+        pass
+
+    def update(self):
+        pass
+
+    def is_animating(self) -> bool:
+        # while true the controller ticks at a fixed rate instead of waiting for events
+        return False
+
+    def view_update(self):
+        raise NotImplementedError
+
+    def redraw(self):
+        pass
+
+
+class MenuScene(Scene):
+    def __init__(self, controller):
+        super().__init__(controller)
+        self.gameMenu = controller.gameMenu
+
+    def enter(self):
+        # no pause before the very first frame
+        if self.controller.running:
+            pygame.time.delay(500)
+        self.gameMenu.init_draw()
+        self.controller.play_music()
+
+    def handle_event(self, event):
+        if event.type == KEYDOWN and event.key == K_ESCAPE:
+            self.controller.exit()
+        elif event.type == MOUSEBUTTONDOWN:
+            self.gauntlet.clicked()
+            spriteClicked = self.gameMenu.allButtons.focused_sprite(event.pos)
+            if spriteClicked:
+                self.gameMenu.view_update()
+                spriteClicked.action()
+        elif event.type == MOUSEBUTTONUP:
+            self.gauntlet.unclicked()
+
+    def view_update(self):
+        self.gameMenu.view_update()
+
+    def redraw(self):
+        self.gameMenu.init_draw()
+
+
+class GameScene(Scene):
+    def __init__(self, controller):
+        super().__init__(controller)
+        self.gameView = None
+        self.gameModel = None
+        self.spriteClicked = False
+        self.startPos = None
+
+    def enter(self):
+        self.gameView = self.controller.game_view()
+        self.gameModel = self.gameView.gameModel
+        pygame.time.delay(500)
+        pygame.mixer.music.stop()
+        self.gameView.init_draw()
+        self.spriteClicked = False
+
+    def handle_event(self, event):
+        if event.type == KEYDOWN and event.key == K_s:
+            self.controller.save_game()
+        elif event.type == KEYDOWN and event.key == K_l:
+            if self.controller.load_game():
+                self.spriteClicked = False
+        elif event.type == KEYDOWN and event.key == K_u:
+            self.gameModel.unmake_move()
+            self.spriteClicked = False
+        elif event.type == KEYDOWN and event.key == K_r:
+            self.controller.play(self.gameModel.redo_move)
+            self.spriteClicked = False
+        elif event.type == KEYDOWN and event.key == K_t:
+            self.gameView.toggle_threats()
+        elif event.type == MOUSEBUTTONDOWN:
+            self.gauntlet.clicked()
+            self.board_clicked(event.pos)
+        elif event.type == MOUSEBUTTONUP:
+            self.gauntlet.unclicked()
+
+    def board_clicked(self, position) -> bool:
+        # first click picks a ball of the active player, second one moves it; returns True after a move
+        position = self.gameView.cartesian2board(position)
+        if not self.spriteClicked:
+            if self.gameModel.color_at(position) == self.gameModel.activePlayer.color:
+                self.startPos = position
+                self.spriteClicked = True
+            return False
+        self.spriteClicked = False
+        if self.controller.play(self.gameModel.move_ball, self.startPos, position):
+            self.gameModel.change_player()
+            return True
+        return False
+
+    def view_update(self):
+        self.gameView.view_update()
+
+    def redraw(self):
+        self.gameView.init_draw()
+
+
+class ComputerGameScene(GameScene):
+    def __init__(self, controller):
+        super().__init__(controller)
+        self.computerThinker = None
+        self.player1Turn = True
+
+    def enter(self):
+        super().enter()
+        self.computerThinker = self.controller.computerThinker
+        self.player1Turn = self.gameModel.activePlayer is self.gameModel.player1
+
+    def leave(self):
+        self.computerThinker.cancel()
+        self.gameView.thinking = False
+
+    def handle_event(self, event):
+        if event.type == ComputerThinker.moveReady:
+            if not self.player1Turn and self.computerThinker.is_ready():
+                profiler = self.controller.profiler
+                profiler.mark("events")
+                move = self.computerThinker.take_move()
+                if move is None:
+                    # stopped before the search had a move, any legal one will do
+                    move = next(self.gameModel.legal_moves(self.gameModel.activePlayer.color), None)
+                if move is None:
+                    self.controller.end_game(drawn=True)
+                elif self.controller.play(self.gameModel.move_ball, *move):
+                    self.gameModel.change_player()
+                    self.player1Turn = True
+                profiler.mark("ai")
+        elif event.type == KEYDOWN and event.key == K_ESCAPE and not self.player1Turn:
+            self.controller.main_menu()
+        elif event.type == KEYDOWN and event.key == K_SPACE and not self.player1Turn:
+            self.computerThinker.force()
+        elif event.type == KEYDOWN and event.key == K_s and self.player1Turn:
+            self.controller.save_game()
+        elif event.type == KEYDOWN and event.key == K_l:
+            self.computerThinker.cancel()
+            if self.controller.load_game():
+                self.spriteClicked = False
+            self.player1Turn = self.gameModel.activePlayer is self.gameModel.player1
+        elif event.type == KEYDOWN and event.key == K_u:
+            # back to the last position with player 1 to move, the computer's reply is taken back too
+            self.computerThinker.cancel()
+            while self.gameModel.unmake_move() and self.gameModel.activePlayer is not self.gameModel.player1:
+                pass
+            self.player1Turn = self.gameModel.activePlayer is self.gameModel.player1
+            self.spriteClicked = False
+        elif event.type == KEYDOWN and event.key == K_r and self.player1Turn:
+            while self.controller.play(self.gameModel.redo_move) and \
+                    self.gameModel.activePlayer is not self.gameModel.player1:
+                pass
+            self.player1Turn = self.gameModel.activePlayer is self.gameModel.player1
+            self.spriteClicked = False
+        elif event.type == KEYDOWN and event.key == K_t:
+            self.gameView.toggle_threats()
+        elif event.type == MOUSEBUTTONDOWN:
+            self.gauntlet.clicked()
+            if self.player1Turn and self.board_clicked(event.pos):
+                self.player1Turn = False
+        elif event.type == MOUSEBUTTONUP:
+            self.gauntlet.unclicked()
+
+    def update(self):
+        if not self.player1Turn and not self.computerThinker.is_thinking() and not self.computerThinker.is_ready():
+            self.controller.profiler.mark("update")
+            # the search runs on the model's bitboard, the threat markers are taken before it starts
+            self.gameView.threats_update()
+            self.computerThinker.start()
+            self.controller.profiler.mark("ai")
+        self.gameView.thinking = self.computerThinker.is_thinking()
+
+    def is_animating(self) -> bool:
+        # the thinking indicator spins while the search runs
+        return self.computerThinker.is_thinking()
 
 
 class GameController:
     FPS = 30
+    # longest time an idle scene sleeps in pygame.event.wait before it is redrawn anyway
+    idleTimeout = 1000
+    printLoopReport = False
+    # frame profiler keys: overlay on/off (also starts recording), dump CSV and Chrome trace, start/stop a capture
+    overlayKey = K_F3
+    dumpKey = K_F4
+    captureKey = K_F5
+    profileOnStart = False
+    startupTarget = 0.3
     music = "stronghold.mp3"
+    # how long the winning move stays on the board before the menu comes back, in milliseconds
+    endGameDelay = 1500
+    savedGame = "saved.game"
 
-    def __init__(self, gameView: GameView, gameMenu: GameMenu):
+    def __init__(self, gameView, gameMenu: GameMenu, startupSteps: list = None):
+        # gameView may be None, it is then built when a game is started for the first time
         self.muted = False
 
         self.gauntlet = Gauntlet()
         self.gauntlet.muted = self.muted
 
-        self.gameView = gameView
-        self.gameView.gauntlet = self.gauntlet
+        self.profiler = FrameProfiler()
+        self.profiler.recording = self.profileOnStart
+        self.profilerOverlay = ProfilerOverlay(self.profiler)
+        self.validMoveCalls = 0
 
-        self.gameModel = self.gameView.gameModel
+        self.gameView = None
+        self.gameModel = None
+        self.computerThinker = None
+        self.preloader = None
+        if gameView is not None:
+            self.set_game_view(gameView)
 
         self.gameMenu = gameMenu
         self.gameMenu.gauntlet = self.gauntlet
+        self.gameMenu.profiler = self.profiler
+
 
         self.gameMenu.playButton.action = self.main_game
         self.gameMenu.quitButton.action = self.exit
 
         self.clock = pygame.time.Clock()
+        self.musicLoaded = False
+
+        # (label, perf_counter) pairs from process start, reported once the first frame is shown
+        self.startupSteps = startupSteps
 
-        pygame.mixer.music.load(os.path.join(FunContainer.data_dir, self.music))
+        self.menuScene = MenuScene(self)
+        self.gameScene = GameScene(self)
+        self.computerGameScene = ComputerGameScene(self)
+        self.scene = None
+        self.running = False
+
+        # event loop counters, see loop_report
+        self.idleWakeups = 0
+        self.idleTimeouts = 0
+        self.animatedFrames = 0
+        self.idleTime = 0.0
+        self.frameTime = 0.0
+        self.maxFrameTime = 0.0
+
+    def set_game_view(self, gameView):
+        self.gameView = gameView
+        self.gameView.gauntlet = self.gauntlet
+        self.gameView.profiler = self.profiler
+        self.gameModel = gameView.gameModel
+        self.validMoveCalls = self.gameModel.validMoveCalls
+        self.computerThinker = ComputerThinker(self.gameModel)
+
+    def preload(self):
+        # background thread started behind the first menu frame; surfaces need the display and are left to game_view
+        from GameModel import GameModel
+        # imported for the import time only, game_view imports it again from sys.modules
+        importlib.import_module("GameView")
+        self.gameModel = GameModel()
+
+    def start_preloader(self):
+        if self.gameView is None and self.preloader is None:
+            self.preloader = threading.Thread(target=self.preload, daemon=True)
+            self.preloader.start()
+
+    def game_view(self):
+        if self.gameView is None:
+            if self.preloader is not None:
+                self.preloader.join()
+            from GameModel import GameModel
+            from GameView import GameView
+            self.set_game_view(GameView(self.gameMenu.screen, self.gameModel or GameModel()))
+        return self.gameView
+
+    def play_music(self):
+        if self.muted or pygame.mixer.music.get_busy():
+            return
+        if not self.musicLoaded:
+            pygame.mixer.music.load(os.path.join(FunContainer.data_dir, self.music))
+            self.musicLoaded = True
+        pygame.mixer.music.play(-1)
+
+    def startup_report(self) -> str:
+        steps = []
+        for (label, moment), (_, previous) in zip(self.startupSteps[1:], self.startupSteps):
+            steps.append("{} {:.0f}ms".format(label, 1000 * (moment - previous)))
+        total = self.startupSteps[-1][1] - self.startupSteps[0][1]
+        return "first frame after {:.0f}ms, target {:.0f}ms ({})".format(
+            1000 * total, 1000 * self.startupTarget, ", ".join(steps))
+
+    def change_scene(self, scene: Scene):
+        if self.scene is not None:
+            self.scene.leave()
+        self.scene = scene
+        scene.enter()
+        if not self.running:
+            self.run()
 
     def main_menu(self):
-        if not pygame.mixer.music.get_busy() and not self.muted:
-            pygame.mixer.music.play(-1)
-        pygame.time.delay(500)
-        self.gameMenu.init_draw()
-        while True:
-            self.clock.tick(self.FPS)
-            for event in pygame.event.get():
-                if event.type == QUIT:
-                    self.exit()
-                elif event.type == KEYDOWN and event.key == K_ESCAPE:
-                    self.exit()
-                elif event.type == MOUSEBUTTONDOWN:
-                    self.gauntlet.clicked()
-                    pos = pygame.mouse.get_pos()
-                    spriteClicked = self.gameMenu.allButtons.focused_sprite(pos)
-                    if spriteClicked:
-                        self.gameMenu.view_update()
-                        spriteClicked.action()
-                elif event.type == MOUSEBUTTONUP:
-                    self.gauntlet.unclicked()
-            self.gameMenu.view_update()
+        self.change_scene(self.menuScene)
+
+    def play(self, action, *args) -> bool:
+        # calls a model move, move_ball or redo_move, that may reach a throne; False once the game is over
+        from GameModel import EndGame
+        try:
+            return action(*args)
+        except EndGame:
+            self.end_game()
+            return False
+
+    def end_game(self, drawn: bool = False):
+        # the winner is the player who made the last move, drawn when the side to move has no moves left;
+        # the next game starts from the initial position
+        self.gameView.thinking = False
+        self.scene.view_update()
+        if drawn:
+            print("{} has no moves, draw".format(self.gameModel.activePlayer.color.name.capitalize()))
+        else:
+            print("{} wins".format(self.gameModel.activePlayer.color.name.capitalize()))
+        pygame.time.delay(self.endGameDelay)
+        self.gameModel.new_game()
+        self.gameView.balls_reset()
+        self.main_menu()
 
     def main_game(self):
-        pygame.time.delay(500)
-        pygame.mixer.music.stop()
-        self.gameView.init_draw()
-        spriteClicked = None
-        while True:
-            self.clock.tick(self.FPS)
-            for event in pygame.event.get():
-                if event.type == QUIT:
-                    self.exit()
-                # elif event.type == KEYDOWN and event.key == K_ESCAPE:
-                #     self.game.new_game()
-                #     self.set_player_indicator()
-                #     self.main_menu()
-                # elif event.type == KEYDOWN and event.key == K_s:
-                #     self.game.save_game()
-                # elif event.type == KEYDOWN and event.key == K_l:
-                #     self.game.load_game()
-                elif event.type == MOUSEBUTTONDOWN:
-                    self.gauntlet.clicked()
-                    if not spriteClicked:
-                        pos1 = pygame.mouse.get_pos()
-                        pos1 = self.gameView.cartesian2board(pos1)
-                        ballsClickedColor = self.gameModel.ballsMap[pos1]
-                        if ballsClickedColor == self.gameModel.activePlayer.color:
-                            spriteClicked = True
-                    else:
-                        pos2 = pygame.mouse.get_pos()
-                        pos2 = self.gameView.cartesian2board(pos2)
-                        try:
-                            if self.gameModel.move_ball(pos1, pos2):
-                                self.gameView.balls_update()
-                                self.gameModel.change_player()
-                        except(SystemExit):
-                            exit(0)
-                            # self.game.new_game()
-                            # self.set_player_indicator()
-                            # self.main_menu()
-                        spriteClicked = False
-                elif event.type == MOUSEBUTTONUP:
-                    self.gauntlet.unclicked()
-            self.gameView.view_update()
+        self.change_scene(self.gameScene)
 
     def player_vs_computer(self):
-        pygame.time.delay(500)
-        pygame.mixer.music.stop()
-        self.gameView.init_draw()
-        spriteClicked = None
-        player1Turn = True
+        self.change_scene(self.computerGameScene)
+
+    def run(self):
+        # sleeps in pygame.event.wait while nothing changes, ticks at FPS only while the scene animates
+        self.running = True
         while True:
-            self.clock.tick(self.FPS)
-            for event in pygame.event.get():
+            if self.scene.is_animating():
+                self.clock.tick(self.FPS)
+                events = pygame.event.get()
+                self.animatedFrames += 1
+            else:
+                startTime = time.perf_counter()
+                event = pygame.event.wait(self.idleTimeout)
+                self.idleTime += time.perf_counter() - startTime
+                if event.type == NOEVENT:
+                    events = []
+                    self.idleTimeouts += 1
+                else:
+                    events = [event] + pygame.event.get()
+                    self.idleWakeups += 1
+            startTime = time.perf_counter()
+            profiler = self.profiler
+            profiler.begin_frame()
+            for event in events:
                 if event.type == QUIT:
                     self.exit()
-                # elif event.type == KEYDOWN and event.key == K_ESCAPE:
-                #     self.game.new_game()
-                #     self.set_player_indicator()
-                #     self.main_menu()
-                # elif event.type == KEYDOWN and event.key == K_s:
-                #     self.game.save_game()
-                # elif event.type == KEYDOWN and event.key == K_l:
-                #     self.game.load_game()
-                if player1Turn:
-                    if event.type == MOUSEBUTTONDOWN:
-                        self.gauntlet.clicked()
-                        if not spriteClicked:
-                            pos1 = pygame.mouse.get_pos()
-                            pos1 = self.gameView.cartesian2board(pos1)
-                            ballsClickedColor = self.gameModel.ballsMap[pos1]
-                            if ballsClickedColor == self.gameModel.activePlayer.color:
-                                spriteClicked = True
-                                print("Sprite clicked")
-                        else:
-                            pos2 = pygame.mouse.get_pos()
-                            pos2 = self.gameView.cartesian2board(pos2)
-                            try:
-                                if self.gameModel.move_ball(pos1, pos2):
-                                    self.gameView.balls_update()
-                                    self.gameModel.change_player()
-                                    player1Turn = False
-                                    print("player changed")
-                            except(SystemExit):
-                                exit(0)
-                                # self.game.new_game()
-                                # self.set_player_indicator()
-                                # self.main_menu()
-                            print("Sprite unclicked")
-                            spriteClicked = False
-                    elif event.type == MOUSEBUTTONUP:
-                        self.gauntlet.unclicked()
+                elif event.type == KEYDOWN and event.key in (self.overlayKey, self.dumpKey, self.captureKey):
+                    self.profiler_key(event.key)
                 else:
-                    self.gameModel.intelligent_move()
-                    self.gameView.balls_update()
-                    player1Turn = True
-            self.gameView.view_update()
+                    self.scene.handle_event(event)
+            profiler.mark("events")
+            self.scene.update()
+            profiler.mark("update")
+            self.scene.view_update()
+            if self.profilerOverlay.visible:
+                self.profilerOverlay.draw(self.gameMenu.screen)
+            profiler.mark("render")
+            if self.gameModel is not None:
+                profiler.count("validMoves", self.gameModel.validMoveCalls - self.validMoveCalls)
+                self.validMoveCalls = self.gameModel.validMoveCalls
+            profiler.end_frame()
+            if self.startupSteps:
+                self.startupSteps.append(("first frame", time.perf_counter()))
+                print("Startup: {}".format(self.startup_report()))
+                self.startupSteps = None
+                self.start_preloader()
+            frameTime = time.perf_counter() - startTime
+            self.frameTime += frameTime
+            self.maxFrameTime = max(self.maxFrameTime, frameTime)
 
-    @classmethod
-    def exit(cls):
-        pygame.time.delay(500)
-        pygame.quit()
-        sys.exit(0)
+    def profiler_key(self, key):
+        if key == self.overlayKey:
+            self.profilerOverlay.visible = not self.profilerOverlay.visible
+            if self.profilerOverlay.visible and not self.profiler.recording:
+                self.profiler.recording = True
+                self.profiler.begin_frame()
+            else:
+                self.scene.redraw()
+        elif key == self.dumpKey:
+            if self.profiler.frames:
+                print("Frames written to {} and {}".format(*self.profiler.dump()))
+            else:
+                print("No frames recorded, press F3 to start recording")
+        elif self.profiler.capturing():
+            print("Profile written to {}".format(self.profiler.stop_capture()))
+        else:
+            self.profiler.start_capture()
+
+    def loop_report(self) -> str:
+        frames = self.idleWakeups + self.idleTimeouts + self.animatedFrames
+        return "frames {} (animated {} woken {} timed out {}) idle {:.1f}s frame avg {:.2f}ms max {:.2f}ms".format(
+            frames, self.animatedFrames, self.idleWakeups, self.idleTimeouts, self.idleTime,
+            1000 * self.frameTime / max(frames, 1), 1000 * self.maxFrameTime)
 
+    def save_game(self):
+        self.gameModel.save_game(os.path.join(FunContainer.data_dir, self.savedGame))
 
+    def load_game(self) -> bool:
+        from GameRecord import GameRecordError
+        path = os.path.join(FunContainer.data_dir, self.savedGame)
+        if not os.path.exists(path):
+            print("No saved game {}".format(path))
+            return False
+        try:
+            self.gameModel.load_game(path)
+        except GameRecordError as error:
+            print("Cannot load saved game: {}".format(error))
+            return False
+        self.gameView.balls_reset()
+        return True
 
+    def exit(self):
+        if self.scene is not None:
+            self.scene.leave()
+        if self.printLoopReport:
+            print("Event loop: {}".format(self.loop_report()))
+        pygame.time.delay(500)
+        pygame.quit()
+        sys.exit(0)
@@ -0,0 +1,48 @@
+class GameEvent:
+    # events published by GameModel; ply is the number of moves played before the event's move
+    __slots__ = ("ply",)
+
+
+class MoveEvent(GameEvent):
+    __slots__ = ("startPos", "endPos", "color")
+
+    def __init__(self, startPos: tuple, endPos: tuple, color, ply: int):
+        self.startPos = startPos
+        self.endPos = endPos
+        self.color = color
+        self.ply = ply
+
+
+class CaptureEvent(GameEvent):
+    # color is the color of the captured ball, published before the MoveEvent of the capturing move
+    __slots__ = ("position", "color")
+
+    def __init__(self, position: tuple, color, ply: int):
+        self.position = position
+        self.color = color
+        self.ply = ply
+
+
+class WinEvent(GameEvent):
+    # published after the MoveEvent that reached the throne, before EndGame is raised
+    __slots__ = ("color", "throne")
+
+    def __init__(self, color, throne: tuple, ply: int):
+        self.color = color
+        self.throne = throne
+        self.ply = ply
+
+
+class UnmakeEvent(GameEvent):
+    # a move taken back, capturedColor is the color of the ball put back on endPos or None; ply is the move's own
+    __slots__ = ("startPos", "endPos", "color", "capturedColor")
+
+    def __init__(self, startPos: tuple, endPos: tuple, color, capturedColor, ply: int):
+        self.startPos = startPos
+        self.endPos = endPos
+        self.color = color
+        self.capturedColor = capturedColor
+        self.ply = ply
+
+
+eventTypes = (MoveEvent, CaptureEvent, WinEvent, UnmakeEvent)
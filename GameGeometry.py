@@ -0,0 +1,50 @@
+class BoardGeometry:
+    # pixel layout of a square board drawn inside a window, cells are indexed row * numOfCells + column
+    # like the bitboard; everything is computed once into flat tuples of plain ints
+
+    def __init__(self, numOfCells: int, windowWidth: int, windowHeight: int, marginWidth: int, marginHeight: int):
+        self.numOfCells = numOfCells
+        self.windowWidth = windowWidth
+        self.windowHeight = windowHeight
+        self.cellWidth = (windowWidth - 2 * marginWidth) // numOfCells
+        self.cellHeight = (windowHeight - 2 * marginHeight) // numOfCells
+        # the rest of the division is shared by both margins
+        self.marginWidth = marginWidth + (windowWidth - 2 * marginWidth) % numOfCells // 2
+        self.marginHeight = marginHeight + (windowHeight - 2 * marginHeight) % numOfCells // 2
+
+        rects = []
+        centers = []
+        for row in range(numOfCells):
+            for column in range(numOfCells):
+                left = column * self.cellWidth + self.marginWidth
+                top = row * self.cellHeight + self.marginHeight
+                # one pixel less so that neighbouring cells do not overlap
+                rects.append((left, top, self.cellWidth - 1, self.cellHeight - 1))
+                centers.append((left + (self.cellWidth - 1) // 2, top + (self.cellHeight - 1) // 2))
+        self.rects = tuple(rects)
+        self.centers = tuple(centers)
+        self.positions = tuple((row, column) for row in range(numOfCells) for column in range(numOfCells))
+
+        # pixel to row/column, clamped to the board
+        self.rowOfY = tuple(self.clamp((y - self.marginHeight) // self.cellHeight) for y in range(windowHeight))
+        self.columnOfX = tuple(self.clamp((x - self.marginWidth) // self.cellWidth) for x in range(windowWidth))
+
+    def clamp(self, index: int) -> int:
+        return min(max(index, 0), self.numOfCells - 1)
+
+    def cell(self, position) -> int:
+        return position[0] * self.numOfCells + position[1]
+
+    def cell_at(self, pixel) -> int:
+        x = min(max(pixel[0], 0), self.windowWidth - 1)
+        y = min(max(pixel[1], 0), self.windowHeight - 1)
+        return self.rowOfY[y] * self.numOfCells + self.columnOfX[x]
+
+    def position_at(self, pixel) -> tuple:
+        return self.positions[self.cell_at(pixel)]
+
+    def rect(self, position) -> tuple:
+        return self.rects[position[0] * self.numOfCells + position[1]]
+
+    def center(self, position) -> tuple:
+        return self.centers[position[0] * self.numOfCells + position[1]]
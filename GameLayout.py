@@ -0,0 +1,100 @@
+import os
+
+import numpy as np
+
+
+class BoardLayoutError(Exception):
+    pass
+
+
+class BoardLayout:
+    # a board read from resources/layouts/<name>.txt, see classic.txt for the format;
+    # positions are (row, column), masks have bit row * numOfCells + column set like the bitboard
+    layoutsDir = os.path.join(os.path.split(os.path.abspath(__file__))[0], "resources", "layouts")
+    suffix = ".txt"
+    comment = ";"
+    walls = "#PQ"
+    symbols = ".#12pPqQ"
+    # moves are kept as start * cells + end in int32 arrays, shifted left by one with a capture flag on the move stack,
+    # which overflows past 181 cells a side
+    maxNumOfCells = 181
+
+    # process-wide cache, layouts are never changed after loading
+    layouts = {}
+
+    def __init__(self, name: str, rows: list):
+        self.name = name
+        self.rows = rows
+        self.numOfCells = len(rows)
+        self.validate()
+
+        n = self.numOfCells
+        self.wallsMap = np.array([[symbol in self.walls for symbol in row] for row in rows], dtype=bool)
+        self.wallsMap.flags.writeable = False
+        self.player1Balls = self.find("pP")
+        self.player2Balls = self.find("qQ")
+        self.player1ThronePos = self.find("1")[0]
+        self.player2ThronePos = self.find("2")[0]
+
+        self.wallsMask = 0
+        for row, column in zip(*np.nonzero(self.wallsMap)):
+            self.wallsMask |= 1 << int(row * n + column)
+        self.thronesMask = 0
+        for row, column in (self.player1ThronePos, self.player2ThronePos):
+            self.thronesMask |= 1 << (row * n + column)
+
+    def validate(self):
+        n = self.numOfCells
+        if not 2 <= n <= self.maxNumOfCells:
+            raise BoardLayoutError("Layout {} has {} rows, expected 2 to {}".format(self.name, n, self.maxNumOfCells))
+        for i, row in enumerate(self.rows):
+            if len(row) != n:
+                raise BoardLayoutError("Layout {} is not square: row {} has {} cells instead of {}".format(
+                    self.name, i, len(row), n))
+            for symbol in row:
+                if symbol not in self.symbols:
+                    raise BoardLayoutError("Layout {} has unknown cell {!r} in row {}".format(self.name, symbol, i))
+        counts = {symbol: sum(row.count(symbol) for row in self.rows) for symbol in self.symbols}
+        for throne in "12":
+            if counts[throne] != 1:
+                raise BoardLayoutError("Layout {} needs exactly one throne {}, found {}".format(
+                    self.name, throne, counts[throne]))
+        for player, stones in ((1, "pP"), (2, "qQ")):
+            if not counts[stones[0]] + counts[stones[1]]:
+                raise BoardLayoutError("Layout {} has no stones of player {}".format(self.name, player))
+
+    def find(self, symbols: str) -> list:
+        return [(row, column) for row, line in enumerate(self.rows) for column, symbol in enumerate(line)
+                if symbol in symbols]
+
+    def bitboard_layout(self) -> tuple:
+        # what Bitboard.from_layout takes
+        return self.numOfCells, self.wallsMask, self.thronesMask
+
+    @classmethod
+    def parse(cls, name: str, text: str) -> "BoardLayout":
+        rows = []
+        for line in text.splitlines():
+            line = line.strip()
+            if line and not line.startswith(cls.comment):
+                rows.append(line)
+        return cls(name, rows)
+
+    @classmethod
+    def load(cls, name: str) -> "BoardLayout":
+        # name of a file in layoutsDir without the suffix, or a path
+        layout = cls.layouts.get(name)
+        if layout is None:
+            path = name if os.path.sep in name or name.endswith(cls.suffix) else \
+                os.path.join(cls.layoutsDir, name + cls.suffix)
+            try:
+                with open(path) as file:
+                    text = file.read()
+            except OSError as error:
+                raise BoardLayoutError("Cannot read layout {}: {}".format(name, error))
+            layout = cls.layouts[name] = cls.parse(os.path.splitext(os.path.basename(path))[0], text)
+        return layout
+
+    @classmethod
+    def available(cls) -> list:
+        return sorted(os.path.splitext(name)[0] for name in os.listdir(cls.layoutsDir) if name.endswith(cls.suffix))
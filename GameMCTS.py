@@ -0,0 +1,281 @@
+import math
+import random
+import time
+from array import array
+
+from GameBitboard import Bitboard
+
+
+class MonteCarloTreeSearch:
+    exploration = 1.4
+    timeBudget = 1.0
+    iterations = None
+    maxNodes = 200000
+    maxRolloutPlies = 80
+    checkInterval = 16
+
+    def __init__(self, bitboard: Bitboard, thrones: tuple, timeBudget: float = None, iterations: int = None,
+                 maxNodes: int = None, seed=None):
+        # thrones[color] is the cell a stone of that color has to reach to win
+        self.bitboard = bitboard
+        self.thrones = thrones
+        if timeBudget is not None:
+            self.timeBudget = timeBudget
+        if iterations is not None:
+            self.iterations = iterations
+        if maxNodes is not None:
+            self.maxNodes = maxNodes
+        self.random = random.Random(seed)
+        self.throneLines = tuple(sum(bitboard.rays[throne]) for throne in thrones)
+
+        # nodes live in parallel arrays, the children of a node are a contiguous block
+        self.parents = None
+        self.firstChildren = None
+        self.childCounts = None
+        self.moves = None
+        self.movers = None
+        self.terminals = None
+        self.visits = None
+        self.wins = None
+        self.numOfNodes = 0
+        self.rootState = None
+        self.rootColor = None
+        self.tree_init()
+
+        self.stopped = False
+        self.playouts = 0
+        self.elapsed = 0.0
+        self.reused = 0
+
+    def tree_init(self):
+        self.parents = array("i")
+        self.firstChildren = array("i")
+        self.childCounts = array("H")
+        self.moves = array("i")
+        self.movers = array("b")
+        self.terminals = array("b")
+        self.visits = array("I")
+        self.wins = array("f")
+        self.numOfNodes = 0
+
+    def add_node(self, parent: int, move: int, mover: int, terminal: bool) -> int:
+        self.parents.append(parent)
+        self.firstChildren.append(-1)
+        self.childCounts.append(0)
+        self.moves.append(move)
+        self.movers.append(mover)
+        self.terminals.append(terminal)
+        self.visits.append(0)
+        self.wins.append(0.0)
+        self.numOfNodes += 1
+        return self.numOfNodes - 1
+
+    def stop(self):
+        self.stopped = True
+
+    def playouts_per_second(self) -> float:
+        if not self.elapsed:
+            return 0.0
+        return self.playouts / self.elapsed
+
+    nodes_per_second = playouts_per_second
+
+    def report(self) -> str:
+        return "playouts {} time {:.3f}s playouts/s {:.0f} nodes {} reused {}".format(
+            self.playouts, self.elapsed, self.playouts_per_second(), self.numOfNodes, self.reused)
+
+    def expand(self, node: int, color: int):
+        numOfBits = self.bitboard.numOfBits
+        throne = self.thrones[color]
+        self.firstChildren[node] = self.numOfNodes
+        count = 0
+        for start, end in self.bitboard.legal_moves(color):
+            self.add_node(node, start * numOfBits + end, color, end == throne)
+            count += 1
+        self.childCounts[node] = count
+
+    def select_child(self, node: int) -> int:
+        first = self.firstChildren[node]
+        visits = self.visits
+        wins = self.wins
+        logVisits = math.log(visits[node] or 1)
+        bestChild = first
+        bestValue = -1.0
+        for child in range(first, first + self.childCounts[node]):
+            childVisits = visits[child]
+            if not childVisits:
+                return child
+            value = wins[child] / childVisits + self.exploration * math.sqrt(logVisits / childVisits)
+            if value > bestValue:
+                bestValue = value
+                bestChild = child
+        return bestChild
+
+    def rollout(self, color: int) -> int:
+        # random slides of a random movable stone; a throne reachable in one slide is always taken
+        bitboard = self.bitboard
+        stones = bitboard.stones
+        choice = self.random.choice
+        for ply in range(self.maxRolloutPlies):
+            own = stones[color]
+            if not own:
+                return 1 - color
+            throneBit = 1 << self.thrones[color]
+            candidates = own & self.throneLines[color]
+            while candidates:
+                bit = candidates & -candidates
+                candidates ^= bit
+                if bitboard.targets(bit.bit_length() - 1, color) & throneBit:
+                    return color
+            cells = []
+            while own:
+                bit = own & -own
+                own ^= bit
+                cells.append(bit.bit_length() - 1)
+            offset = self.random.randrange(len(cells))
+            for i in range(len(cells)):
+                start = cells[(offset + i) % len(cells)]
+                targets = bitboard.targets(start, color)
+                if targets:
+                    break
+            else:
+                return -1
+            ends = []
+            while targets:
+                bit = targets & -targets
+                targets ^= bit
+                ends.append(bit.bit_length() - 1)
+            bitboard.move(color, start, choice(ends))
+            color = 1 - color
+        return -1
+
+    def iterate(self):
+        bitboard = self.bitboard
+        numOfBits = bitboard.numOfBits
+        node = 0
+        color = self.rootColor
+        while self.childCounts[node] and not self.terminals[node]:
+            node = self.select_child(node)
+            start, end = divmod(self.moves[node], numOfBits)
+            bitboard.move(color, start, end)
+            color = 1 - color
+        if self.terminals[node]:
+            winner = self.movers[node]
+        else:
+            if (self.visits[node] or node == 0) and self.numOfNodes < self.maxNodes:
+                self.expand(node, color)
+                if self.childCounts[node]:
+                    node = self.firstChildren[node]
+                    start, end = divmod(self.moves[node], numOfBits)
+                    bitboard.move(color, start, end)
+                    color = 1 - color
+            if self.terminals[node]:
+                winner = self.movers[node]
+            else:
+                winner = self.rollout(color)
+        bitboard.set_state(self.rootState)
+        while node >= 0:
+            self.visits[node] += 1
+            if winner < 0:
+                self.wins[node] += 0.5
+            elif winner == self.movers[node]:
+                self.wins[node] += 1.0
+            node = self.parents[node]
+        self.playouts += 1
+
+    def children(self, node: int) -> range:
+        first = self.firstChildren[node]
+        return range(first, first + self.childCounts[node])
+
+    def find_position(self, positionHash: int, color: int) -> int:
+        # the old root position has to be set on the bitboard
+        bitboard = self.bitboard
+        numOfBits = bitboard.numOfBits
+        if self.rootColor == color and bitboard.position_hash(color) == positionHash:
+            return 0
+        rootColor = self.rootColor
+        found = -1
+        for child in self.children(0):
+            start, end = divmod(self.moves[child], numOfBits)
+            captured = bitboard.move(rootColor, start, end)
+            if 1 - rootColor == color and bitboard.position_hash(color) == positionHash:
+                found = child
+            elif rootColor == color:
+                for grandchild in self.children(child):
+                    grandStart, grandEnd = divmod(self.moves[grandchild], numOfBits)
+                    grandCaptured = bitboard.move(1 - rootColor, grandStart, grandEnd)
+                    if bitboard.position_hash(color) == positionHash:
+                        found = grandchild
+                    bitboard.unmake(1 - rootColor, grandStart, grandEnd, grandCaptured)
+                    if found >= 0:
+                        break
+            bitboard.unmake(rootColor, start, end, captured)
+            if found >= 0:
+                break
+        return found
+
+    def reuse_tree(self, color: int) -> bool:
+        # keeps the subtree of the current position if it is at most two plies below the old root
+        if self.rootState is None or not self.numOfNodes:
+            return False
+        bitboard = self.bitboard
+        currentState = bitboard.state()
+        positionHash = bitboard.position_hash(color)
+        bitboard.set_state(self.rootState)
+        found = self.find_position(positionHash, color)
+        bitboard.set_state(currentState)
+        if found < 0:
+            return False
+        self.compact(found)
+        return True
+
+    def compact(self, newRoot: int):
+        old = (self.firstChildren, self.childCounts, self.moves, self.movers, self.terminals, self.visits, self.wins)
+        oldFirstChildren, oldChildCounts, oldMoves, oldMovers, oldTerminals, oldVisits, oldWins = old
+        self.tree_init()
+        self.add_node(-1, oldMoves[newRoot], oldMovers[newRoot], oldTerminals[newRoot])
+        self.visits[0] = oldVisits[newRoot]
+        self.wins[0] = oldWins[newRoot]
+        queue = [(newRoot, 0)]
+        for oldNode, newNode in queue:
+            first = oldFirstChildren[oldNode]
+            if first < 0:
+                continue
+            self.firstChildren[newNode] = self.numOfNodes
+            self.childCounts[newNode] = oldChildCounts[oldNode]
+            for oldChild in range(first, first + oldChildCounts[oldNode]):
+                newChild = self.add_node(newNode, oldMoves[oldChild], oldMovers[oldChild], oldTerminals[oldChild])
+                self.visits[newChild] = oldVisits[oldChild]
+                self.wins[newChild] = oldWins[oldChild]
+                queue.append((oldChild, newChild))
+
+    def search(self, color: int):
+        startTime = time.perf_counter()
+        deadline = startTime + self.timeBudget
+        self.playouts = 0
+        if self.reuse_tree(color):
+            self.reused += 1
+        else:
+            self.tree_init()
+            self.add_node(-1, -1, 1 - color, False)
+        self.rootState = self.bitboard.state()
+        self.rootColor = color
+        # a search stopped before its first playout still answers with a legal move
+        if not self.childCounts[0]:
+            self.expand(0, color)
+        while not self.stopped:
+            self.iterate()
+            if self.iterations is not None and self.playouts >= self.iterations:
+                break
+            if self.iterations is None and not self.playouts % self.checkInterval and time.perf_counter() > deadline:
+                break
+        self.elapsed = time.perf_counter() - startTime
+        if not self.childCounts[0]:
+            return None
+        children = self.children(0)
+        for child in children:
+            if self.terminals[child]:
+                return divmod(self.moves[child], self.bitboard.numOfBits)
+        # without playouts all visits are 0 and this is the first child
+        bestChild = max(children, key=lambda child: self.visits[child])
+        return divmod(self.moves[bestChild], self.bitboard.numOfBits)
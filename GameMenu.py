@@ -2,22 +2,61 @@ import pygame
 from pygame.locals import *
 import os
 
+# pygame 2.1.3 renamed fromstring and tostring, older versions only have the old names
+image_frombytes = getattr(pygame.image, "frombytes", None) or pygame.image.fromstring
+image_tobytes = getattr(pygame.image, "tobytes", None) or pygame.image.tostring
+
 
 class FunContainer:
     main_dir = os.path.split(os.path.abspath(__file__))[0]
     data_dir = os.path.join(main_dir, "resources")
+    # scaled images are also kept as raw pixels here, keyed by the modification time of their source file
+    cache_dir = os.path.join(data_dir, "cache")
+    diskCache = True
+    fontName = "Aller_Lt.ttf"
+
+    # process-wide caches, the surfaces are shared and must not be drawn on
+    images = {}
+    fonts = {}
+    texts = {}
+    sounds = {}
 
     def __init__(self):
         pass
 
     @classmethod
-    def load_image(cls, name, colorkey=None):
+    def image(cls, name, size=None, colorkey=None) -> pygame.Surface:
+        if size is not None:
+            size = tuple(size)
+        key = (name, size, colorkey)
+        image = cls.images.get(key)
+        if image is None:
+            image = cls.images[key] = cls.load_image(name, colorkey, size)
+        return image
+
+    @classmethod
+    def load_image(cls, name, colorkey=None, size=None):
         fullname = os.path.join(cls.data_dir, name)
-        try:
-            image = pygame.image.load(fullname)
-        except pygame.error:
-            print("Cannot load image {}".format(name))
-            raise SystemExit
+        image = None
+        cachedName = None
+        if size is not None and cls.diskCache:
+            try:
+                cachedName = os.path.join(cls.cache_dir, "{}.{}x{}.{}.rgb".format(
+                    name, size[0], size[1], os.stat(fullname).st_mtime_ns))
+                with open(cachedName, "rb") as file:
+                    image = image_frombytes(file.read(), size, "RGB")
+            except (OSError, ValueError):
+                image = None
+        if image is None:
+            try:
+                image = pygame.image.load(fullname)
+            except pygame.error:
+                print("Cannot load image {}".format(name))
+                raise SystemExit
+            if size is not None:
+                image = pygame.transform.scale(image, size)
+                if cachedName is not None:
+                    cls.save_cached_image(image, cachedName)
         image = image.convert()
         if colorkey is not None:
             if colorkey is -1:
@@ -25,6 +64,16 @@ class FunContainer:
             image.set_colorkey(colorkey, RLEACCEL)
         return image
 
+    @classmethod
+    def save_cached_image(cls, image, cachedName):
+        try:
+            os.makedirs(cls.cache_dir, exist_ok=True)
+            with open(cachedName + ".tmp", "wb") as file:
+                file.write(image_tobytes(image, "RGB"))
+            os.replace(cachedName + ".tmp", cachedName)
+        except OSError as error:
+            print("Cannot cache image {}: {}".format(cachedName, error))
+
     @classmethod
     def load_sound(cls, name):
         class NoneSound:
@@ -32,19 +81,30 @@ class FunContainer:
 
         if not pygame.mixer:
             return NoneSound()
-        fullname = os.path.join(cls.data_dir, name)
-        try:
-            sound = pygame.mixer.Sound(fullname)
-        except pygame.error:
-            print("Cannot load sound: {}".format(name))
-            raise SystemExit
+        sound = cls.sounds.get(name)
+        if sound is None:
+            fullname = os.path.join(cls.data_dir, name)
+            try:
+                sound = cls.sounds[name] = pygame.mixer.Sound(fullname)
+            except pygame.error:
+                print("Cannot load sound: {}".format(name))
+                raise SystemExit
         return sound
 
+    @classmethod
+    def font(cls, size):
+        font = cls.fonts.get(size)
+        if font is None:
+            font = cls.fonts[size] = pygame.font.Font(os.path.join(cls.data_dir, cls.fontName), size)
+        return font
+
     @classmethod
     def font_render(cls, text, size):
-        fullname = os.path.join(cls.data_dir, "Aller_Lt.ttf")
-        font = pygame.font.Font(fullname, size)
-        return font.render(text, 1, (0, 0, 0))
+        key = (text, size)
+        image = cls.texts.get(key)
+        if image is None:
+            image = cls.texts[key] = cls.font(size).render(text, 1, (0, 0, 0))
+        return image
 
     @classmethod
     def center_blit(cls, destination: pygame.Surface, image: pygame.Surface, area: pygame.Rect):
@@ -53,7 +113,7 @@ class FunContainer:
         destination.blit(image, imageRect)
 
 
-class Button(pygame.sprite.Sprite):
+class Button(pygame.sprite.DirtySprite):
     def __init__(self, size, text, position):
         super().__init__()
         self.baseImage = FunContainer.font_render(text, size)
@@ -63,10 +123,17 @@ class Button(pygame.sprite.Sprite):
         self.rect.center = position.center
 
     def focus(self):
-        self.image = self.onFocusImage
+        self.set_image(self.onFocusImage)
 
     def unfocus(self):
-        self.image = self.baseImage
+        self.set_image(self.baseImage)
+
+    def set_image(self, image: pygame.Surface):
+        # the focused text is larger, the rect has to grow with it so that it is erased as a whole
+        if image is not self.image:
+            self.image = image
+            self.rect = image.get_rect(topleft=self.rect.topleft)
+            self.dirty = 1
 
     def update(self):
         pos = pygame.mouse.get_pos()
@@ -91,6 +158,9 @@ class ButtonsContainer(pygame.sprite.RenderPlain):
 
 
 class GameMenu:
+    buttonsLayer = 0
+    cursorLayer = 1
+
     windowWidth = 800
     windowHeight = 800
     windowName = "Castle game"
@@ -98,12 +168,10 @@ class GameMenu:
     def __init__(self):
         self.screen = pygame.display.set_mode((self.windowWidth, self.windowHeight))
         pygame.display.set_caption(self.windowName)
-        self.icon = FunContainer.load_image("castle-icon.jpg")
-        self.icon = pygame.transform.scale(self.icon, (32, 32))
+        self.icon = FunContainer.image("castle-icon.jpg", (32, 32))
         pygame.display.set_icon(self.icon)
 
-        self.background = FunContainer.load_image("castle-menu.jpg")
-        self.background = pygame.transform.scale(self.background, (self.windowWidth, self.windowHeight))
+        self.background = FunContainer.image("castle-menu.jpg", (self.windowWidth, self.windowHeight))
         self.playButton = Button(55, "Play", Rect(110, 90, 100, 50))
         self.optionsButton = Button(55, "Options", Rect(110, 200, 100, 50))
         self.quitButton = Button(55, "Quit", Rect(110, 310, 100, 50))
@@ -111,19 +179,27 @@ class GameMenu:
         self.allButtons.add(self.playButton, self.quitButton, self.optionsButton)
 
         self.gauntlet = None
+        self.profiler = None
+        self.allSprites = pygame.sprite.LayeredDirty()
+        self.allSprites.add(self.allButtons.sprites(), layer=self.buttonsLayer)
 
     def init_draw(self):
         self.screen.blit(self.background, (0, 0))
-        self.allButtons.draw(self.screen)
+        self.allSprites.clear(self.screen, self.background)
+        if self.gauntlet is not None and not self.allSprites.has(self.gauntlet):
+            self.allSprites.add(self.gauntlet, layer=self.cursorLayer)
+        for sprite in self.allSprites:
+            sprite.dirty = 1
+        self.allSprites.draw(self.screen)
         pygame.display.update()
 
     def view_update(self):
-        self.screen.blit(self.background, self.gauntlet.rect, self.gauntlet.rect)
-
         self.allButtons.update()
-        self.allButtons.clear(self.screen, self.background)
-        self.allButtons.draw(self.screen)
-
         self.gauntlet.update()
-        self.screen.blit(self.gauntlet.image, self.gauntlet.rect)
-        pygame.display.update()
+        if self.profiler is not None and self.profiler.recording:
+            self.profiler.count("sprites", sum(1 for sprite in self.allSprites if sprite.dirty and sprite.visible))
+        dirtyRects = self.allSprites.draw(self.screen)
+        if dirtyRects:
+            pygame.display.update(dirtyRects)
+            if self.profiler is not None:
+                self.profiler.count("rects", len(dirtyRects))
@@ -1,14 +1,22 @@
-import numpy as np
-from enum import Enum
-import pygame
-from pygame.locals import *
+from array import array
+from enum import IntEnum
+
+from GameBitboard import Bitboard
+from GameLayout import BoardLayout
+from GameBook import OpeningBook
+from GameSearch import SearchEngine
+from GameThreats import ThreatMap
+from GameTransposition import TranspositionTable
+from GameRecord import GameRecord, GameRecordError
+from GameEvents import MoveEvent, CaptureEvent, WinEvent, UnmakeEvent, eventTypes
 
 
 class EndGame(Exception):
     pass
 
 
-class GameColor(Enum):
+class GameColor(IntEnum):
+    # plain ints underneath, they index the bitboard tables directly
     WHITE = 0
     BLACK = 1
 
@@ -21,6 +29,9 @@ class GameColor(Enum):
 
 
 class Player:
+    # balls and opponentThrone are bitboard cells
+    __slots__ = ("color", "balls", "opponentThrone")
+
     def __init__(self, color, balls, opponentThrone):
         self.color = color
         self.balls = balls
@@ -28,126 +39,188 @@ class Player:
 
 
 class GameModel:
-    numOfCells = 19
-
-    initPlayer1BallPositions = [(11, 2), (11, 16), (18, 5), (18, 13), (13, 7), (13, 11), (17, 7), (17, 11)]
-    initPlayer2BallPositions = [(7, 2), (7, 16), (0, 5), (0, 13), (5, 7), (5, 11), (1, 7), (1, 11)]
-
-    player1ThronePos = (3, 9)
-    player2ThronePos = (15, 9)
+    # name of a board in resources/layouts, see GameLayout
+    layoutName = "classic"
 
     player1Color = GameColor.BLACK
 
-    def __init__(self):
-        self.player1 = Player(self.player1Color, self.initPlayer1BallPositions.copy(), self.player2ThronePos)
-        self.player2 = Player(GameColor.second_color(self.player1Color), self.initPlayer2BallPositions.copy(), self.player1ThronePos)
+    searchTimeBudget = 1.0
+    transpositionTableMegabytes = 16
+    searchWorkers = 1
+    # "alphabeta" or "mcts"
+    computerPlayer = "alphabeta"
+    # positions of resources/books/<layout>.book are played without searching, see buildbook.py
+    useOpeningBook = True
+
+    def __init__(self, layout: BoardLayout = None):
+        if layout is None:
+            layout = BoardLayout.load(self.layoutName)
+        self.layout = layout
+        self.numOfCells = layout.numOfCells
+        self.initPlayer1BallPositions = layout.player1Balls
+        self.initPlayer2BallPositions = layout.player2Balls
+        self.player1ThronePos = layout.player1ThronePos
+        self.player2ThronePos = layout.player2ThronePos
+        self.player1 = None
+        self.player2 = None
         self.wallsMap = None
-        self.ballsMap = None
+        self.bitboard = None
+        self.threats = None
+        self.searchEngine = None
+        self.transpositionTable = None
+        # how find_intelligent_move came to its last move, the model leaves printing it to the controller
+        self.moveReport = None
+        # moves are start * numOfBits + end; the stack keeps them shifted left by one with a capture flag in the low bit,
+        # undone moves wait on redoStack
+        self.moveStack = array("i")
+        self.redoStack = array("i")
+        # event type -> handlers called with each published event, see GameEvents
+        self.subscribers = {eventType: [] for eventType in eventTypes}
+        # read by the frame profiler
+        self.validMoveCalls = 0
         self.model_state_init()
         self.activePlayer = self.player1
 
 
     def model_state_init(self):
-        self.wallsMap = np.array([[False]*self.numOfCells]*19, dtype=bool)
-        self.wall_map_init()
-        self.ballsMap = np.array([[None]*19]*19, dtype=GameColor)
+        # the walls map is shared with the layout and read only
+        self.wallsMap = self.layout.wallsMap
+        self.bitboard = Bitboard.from_layout(self.layout.bitboard_layout())
+        cell = self.bitboard.cell
+        # balls are sets of cells so that a move or a capture is O(1)
+        self.player1 = Player(self.player1Color, {cell(position) for position in self.initPlayer1BallPositions},
+                              cell(self.player2ThronePos))
+        self.player2 = Player(GameColor.second_color(self.player1Color),
+                              {cell(position) for position in self.initPlayer2BallPositions}, cell(self.player1ThronePos))
         self.balls_map_init()
-
-    def wall_map_init(self):
-        wallsMap = self.wallsMap
-        for i in range(1, 8):
-            wallsMap[(i, 2)] = True
-            wallsMap[(i, 16)] = True
-            wallsMap[(self.numOfCells - i - 1, 2)] = True
-            wallsMap[(self.numOfCells - i - 1, 16)] = True
-        for i in range(0, 6):
-            wallsMap[(i, 5)] = True
-            wallsMap[(i, 13)] = True
-            wallsMap[(self.numOfCells - i - 1, 5)] = True
-            wallsMap[(self.numOfCells - i - 1, 13)] = True
-        for i in range(1, 6):
-            wallsMap[(i, 7)] = True
-            wallsMap[(i, 11)] = True
-            wallsMap[(self.numOfCells - i - 1, 7)] = True
-            wallsMap[(self.numOfCells - i - 1, 11)] = True
-        for i in range(3, 9):
-            wallsMap[(7, i)] = True
-            wallsMap[(11, i)] = True
-            wallsMap[(7, self.numOfCells - i - 1)] = True
-            wallsMap[(11, self.numOfCells - i - 1)] = True
-        for i in range(7, 12):
-            wallsMap[(5, i)] = True
-            wallsMap[(13, i)] = True
-        wallsMap[(1, 8)] = True
-        wallsMap[(1, 10)] = True
-        wallsMap[(17, 8)] = True
-        wallsMap[(17, 10)] = True
+        # follows the moves of the game, anything else changing the bitboard has to reset it
+        self.threats = ThreatMap(self.bitboard, self.throne_cells())
+        self.searchEngine = None
 
     def balls_map_init(self):
-        for position in self.initPlayer1BallPositions:
-            self.ballsMap[position] = self.player1.color
-
-        for position in self.initPlayer2BallPositions:
-            self.ballsMap[position] = self.player2.color
-
-    def is_something_between(self, map: np.ndarray, startPos: tuple, endPos: tuple, direction, delta, negated=False):
-        # negated parameter:
-        # if false check if there is any wall between clear cells
-        # if true check if there is any clear cell between walls
-        if delta < 0:
-            startPos, endPos = endPos, startPos
-        if direction == 0:
-            for cell in map[startPos[0]+1:endPos[0], startPos[1]]:
-                if np.logical_xor(bool(cell), negated):
-                    return True
-        elif direction == 1:
-            for cell in map[startPos[0], startPos[1]+1:endPos[1]]:
-                if np.logical_xor(bool(cell), negated):
-                    return True
-        return False
+        for player in (self.player1, self.player2):
+            for ball in player.balls:
+                self.bitboard.place(player.color, ball)
+
+    def throne_cells(self) -> tuple:
+        thrones = [None, None]
+        for player in (self.player1, self.player2):
+            thrones[player.color] = player.opponentThrone
+        return tuple(thrones)
+
+    def color_at(self, position: tuple):
+        # GameColor of the ball on position or None
+        cell = self.bitboard.cell(position)
+        for color in GameColor:
+            if self.bitboard.stones[color] >> cell & 1:
+                return color
+        return None
+
+    @property
+    def history(self) -> list:
+        # (startCell, endCell) of every move played, the form games are saved in
+        decode_move = self.bitboard.decode_move
+        return [decode_move(entry >> 1) for entry in self.moveStack]
+
+    def replay_history(self, history: list, player1Color: GameColor) -> tuple:
+        # plays history from the initial position on a scratch bitboard, returns the move stack and the final stones
+        bitboard = Bitboard.from_layout(self.bitboard.layout())
+        player2Color = GameColor.second_color(player1Color)
+        for color, positions in ((player1Color, self.initPlayer1BallPositions), (player2Color, self.initPlayer2BallPositions)):
+            for position in positions:
+                bitboard.place(color, bitboard.cell(position))
+        moveStack = array("i")
+        color = player1Color
+        numOfBits = bitboard.numOfBits
+        for ply, (start, end) in enumerate(history):
+            # saved games are read from disk, a broken one must not index past the tables
+            if not (0 <= start < numOfBits and 0 <= end < numOfBits and bitboard.valid_move(start, end, color)):
+                raise GameRecordError("Saved move {} from cell {} to {} is not legal".format(ply + 1, start, end))
+            captured = bitboard.move(color, start, end)
+            moveStack.append(bitboard.encode_move(start, end) << 1 | captured)
+            color = 1 - color
+        return moveStack, tuple(bitboard.stones)
+
+    def set_position(self, stones: tuple, activeColor: int, history: list, player1Color: int = None):
+        # player balls sets are refilled in place so that views holding them stay valid
+        if player1Color is None:
+            player1Color = self.player1.color
+        if activeColor not in (GameColor.WHITE, GameColor.BLACK) or player1Color not in (GameColor.WHITE, GameColor.BLACK):
+            raise GameRecordError("Saved colours {} and {} are not white or black".format(activeColor, player1Color))
+        moveStack, replayedStones = self.replay_history(history, GameColor(player1Color))
+        if replayedStones != tuple(stones):
+            raise GameRecordError("Saved moves do not lead to the saved position")
+        if player1Color != self.player1.color:
+            self.player1.color, self.player2.color = self.player2.color, self.player1.color
+            self.search_engine_reset()
+            # the map keeps the thrones of the colours as well
+            self.threats = ThreatMap(self.bitboard, self.throne_cells())
+        bitboard = self.bitboard
+        bitboard.set_state((0, 0, 0))
+        for player in (self.player1, self.player2):
+            color = player.color
+            player.balls.clear()
+            player.balls.update(cell for cell in range(bitboard.numOfBits) if stones[color] >> cell & 1)
+            for ball in player.balls:
+                bitboard.place(color, ball)
+        self.threats.reset()
+        self.activePlayer = self.player1 if self.player1.color == activeColor else self.player2
+        self.moveStack = moveStack
+        self.redoStack = array("i")
+
+    def new_game(self):
+        # back to the initial position with player 1 to move, the players keep their colours
+        moveStack, stones = self.replay_history([], self.player1.color)
+        self.set_position(stones, self.player1.color, [])
+
+    def save_game(self, path: str):
+        GameRecord.from_model(self).save(path)
+
+    def load_game(self, path: str):
+        GameRecord.load(path).apply(self)
+
+    def search_engine(self):
+        # built on first use so that headless games which never search stay cheap to create
+        if self.searchEngine is None:
+            # the alternative engines pull in multiprocessing and friends, imported only when chosen
+            if self.computerPlayer == "mcts":
+                from GameMCTS import MonteCarloTreeSearch
+                self.searchEngine = MonteCarloTreeSearch(self.bitboard, self.throne_cells(), self.searchTimeBudget)
+            elif self.searchWorkers > 1:
+                from GameParallelSearch import ParallelSearch
+                self.searchEngine = ParallelSearch(self.bitboard, self.throne_cells(), self.searchTimeBudget,
+                                                   workers=self.searchWorkers)
+            else:
+                if self.transpositionTable is None:
+                    self.transpositionTable = TranspositionTable(self.transpositionTableMegabytes)
+                self.searchEngine = SearchEngine(self.bitboard, self.throne_cells(), self.searchTimeBudget,
+                                                 table=self.transpositionTable)
+        return self.searchEngine
+
+    def search_engine_reset(self):
+        # engines search towards the thrones of the colours they were built with, the table scores too
+        close = getattr(self.searchEngine, "close", None)
+        if close is not None:
+            close()
+        self.searchEngine = None
+        if self.transpositionTable is not None:
+            self.transpositionTable.clear()
 
     def valid_move(self, startPos: tuple, endPos: tuple):
-        dy = endPos[0] - startPos[0]
-        dx = endPos[1] - startPos[1]
-        delta = dy
-        direction = 0
-        if not np.logical_xor(dx, dy):
-            return False
-        if not dy:
-            delta = dx
-            direction = 1
-        isStartWall = self.wallsMap[startPos]
-        isEndWall = self.wallsMap[endPos]
-        if np.logical_xor(isStartWall, isEndWall):
-            if abs(delta) > 1:
-                return False
-        elif not isStartWall and not isEndWall:
-            if self.is_something_between(self.wallsMap, startPos, endPos, direction, delta):
-                return False
-        else:
-            if self.is_something_between(self.wallsMap, startPos, endPos, direction, delta, True):
-                return False
-        if self.is_something_between(self.ballsMap, startPos, endPos, direction, delta):
-            return False
-        if self.ballsMap[endPos]:
-            if self.ballsMap[endPos] == self.activePlayer.color:
-                return False
-        if direction:
-            if self.player1ThronePos[0] == startPos[0]:
-                if min(startPos[1], endPos[1]) < self.player1ThronePos[1] < max(startPos[1], endPos[1]):
-                    return False
-            if self.player2ThronePos[0] == startPos[0]:
-                if min(startPos[1], endPos[1]) < self.player2ThronePos[1] < max(startPos[1], endPos[1]):
-                    return False
-        else:
-            if self.player1ThronePos[1] == startPos[1]:
-                if min(startPos[0], endPos[0]) < self.player1ThronePos[0] < max(startPos[0], endPos[0]):
-                    return False
-            if self.player2ThronePos[1] == startPos[1]:
-                if min(startPos[0], endPos[0]) < self.player2ThronePos[0] < max(startPos[0], endPos[0]):
-                    return False
+        self.validMoveCalls += 1
+        bitboard = self.bitboard
+        return bitboard.valid_move(bitboard.cell(startPos), bitboard.cell(endPos), self.activePlayer.color)
 
-        return True
+    def legal_moves(self, color: GameColor):
+        positions = self.bitboard.positions
+        for start, end in self.bitboard.legal_moves(color):
+            yield positions[start], positions[end]
+
+    def subscribe(self, eventType, handler):
+        self.subscribers[eventType].append(handler)
+
+    def unsubscribe(self, eventType, handler):
+        self.subscribers[eventType].remove(handler)
 
     def change_player(self):
         self.activePlayer = self.second_player()
@@ -159,19 +232,121 @@ class GameModel:
             return self.player1
 
     def move_ball(self, startPos: tuple, endPos: tuple) -> bool:
-        ballsMoving = self.activePlayer.balls
-        if not self.valid_move(startPos, endPos):
+        # (row, column) positions of the view, the model itself works on cells
+        bitboard = self.bitboard
+        return self.make_move(bitboard.cell(startPos), bitboard.cell(endPos))
+
+    def make_move(self, startCell: int, endCell: int) -> bool:
+        self.validMoveCalls += 1
+        bitboard = self.bitboard
+        player = self.activePlayer
+        color = player.color
+        if not bitboard.valid_move(startCell, endCell, color):
+            return False
+        captured = bitboard.stones[1 - color] >> endCell & 1
+        if captured:
+            self.beat(endCell)
+        bitboard.move(color, startCell, endCell)
+        self.threats.touch(startCell, endCell)
+        player.balls.remove(startCell)
+        player.balls.add(endCell)
+        move = bitboard.encode_move(startCell, endCell)
+        # playing the next undone move keeps the rest of the redo line, any other move drops it
+        if self.redoStack and self.redoStack[-1] == move:
+            self.redoStack.pop()
+        elif self.redoStack:
+            self.redoStack = array("i")
+        # events are only built when somebody listens, headless games skip them
+        handlers = self.subscribers[MoveEvent]
+        if handlers:
+            positions = bitboard.positions
+            event = MoveEvent(positions[startCell], positions[endCell], color, len(self.moveStack))
+            for handler in handlers:
+                handler(event)
+        self.moveStack.append(move << 1 | captured)
+        if player.opponentThrone == endCell:
+            handlers = self.subscribers[WinEvent]
+            if handlers:
+                event = WinEvent(color, bitboard.positions[endCell], len(self.moveStack) - 1)
+                for handler in handlers:
+                    handler(event)
+            raise EndGame
+        return True
+
+    def unmake_move(self) -> bool:
+        # takes back the last move and gives the turn back to the player who made it
+        if not self.moveStack:
+            return False
+        bitboard = self.bitboard
+        entry = self.moveStack.pop()
+        move = entry >> 1
+        captured = entry & 1
+        startCell, endCell = bitboard.decode_move(move)
+        mover, opponent = self.player1, self.player2
+        if not bitboard.stones[mover.color] >> endCell & 1:
+            mover, opponent = opponent, mover
+        mover.balls.remove(endCell)
+        mover.balls.add(startCell)
+        if captured:
+            opponent.balls.add(endCell)
+        bitboard.unmake(mover.color, startCell, endCell, captured)
+        self.threats.touch(startCell, endCell)
+        self.activePlayer = mover
+        self.redoStack.append(move)
+        handlers = self.subscribers[UnmakeEvent]
+        if handlers:
+            positions = bitboard.positions
+            event = UnmakeEvent(positions[startCell], positions[endCell], mover.color,
+                                opponent.color if captured else None, len(self.moveStack))
+            for handler in handlers:
+                handler(event)
+        return True
+
+    def redo_move(self) -> bool:
+        # plays the last undone move and passes the turn like the controller does; may raise EndGame
+        if not self.redoStack:
+            return False
+        if not self.make_move(*self.bitboard.decode_move(self.redoStack[-1])):
+            self.redoStack = array("i")
             return False
+        self.change_player()
+        return True
+
+    def book_move(self):
+        if not self.useOpeningBook:
+            return None
+        book = OpeningBook.load(self.layout)
+        if book is None:
+            return None
+        return book.lookup(self.bitboard, self.activePlayer.color)
+
+    def find_intelligent_move(self):
+        self.moveReport = None
+        move = self.book_move()
+        if move is not None:
+            # the book is loaded once per layout, book_move found it
+            self.moveReport = "Book: {}".format(OpeningBook.load(self.layout).describe(move))
         else:
-            if self.ballsMap[endPos]:
-                self.beat(endPos)
-            self.ballsMap[startPos] = None
-            self.ballsMap[endPos] = self.activePlayer.color
-            ballsMoving[ballsMoving.index(startPos)] = endPos
-            if self.activePlayer.opponentThrone == endPos:
-                raise EndGame
-            return True
-
-    def beat(self, endPos: tuple):
-        ballsFromWhichRemoving = self.second_player().balls
-        ballsFromWhichRemoving.remove(endPos)
+            searchEngine = self.search_engine()
+            move = searchEngine.search(self.activePlayer.color)
+            self.moveReport = "Search: {}".format(searchEngine.report())
+        if move is None:
+            return None
+        positions = self.bitboard.positions
+        return positions[move[0]], positions[move[1]]
+
+    def intelligent_move(self) -> bool:
+        move = self.find_intelligent_move()
+        if move is None:
+            return False
+        return self.move_ball(*move)
+
+    def beat(self, endCell: int):
+        opponent = self.second_player()
+        opponent.balls.remove(endCell)
+        self.bitboard.remove(opponent.color, endCell)
+        handlers = self.subscribers[CaptureEvent]
+        if handlers:
+            event = CaptureEvent(self.bitboard.positions[endCell], opponent.color, len(self.moveStack))
+            for handler in handlers:
+                handler(event)
@@ -0,0 +1,127 @@
+import os
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait
+
+from GameBitboard import Bitboard
+from GameSearch import SearchEngine, SearchTimeout
+from GameTransposition import TranspositionTable
+
+workerEngine = None
+
+
+def search_worker_init(layout: tuple, thrones: tuple, tableMegabytes: float, stopEvent):
+    global workerEngine
+    table = TranspositionTable(tableMegabytes) if tableMegabytes else None
+    workerEngine = SearchEngine(Bitboard.from_layout(layout), thrones, table=table)
+    workerEngine.stopEvent = stopEvent
+
+
+def search_worker(state: tuple, color: int, moves: list, depth: int, deadline: float) -> tuple:
+    # searches its share of the root moves; the deadline is wall-clock time shared with the parent
+    engine = workerEngine
+    engine.bitboard.set_state(state)
+    engine.threats.reset()
+    engine.nodes = 0
+    engine.deadline = time.perf_counter() + deadline - time.time()
+    if engine.table is not None:
+        engine.table.new_search()
+    try:
+        move, score = engine.search_root(color, depth, moves)
+    except SearchTimeout:
+        engine.bitboard.set_state(state)
+        engine.threats.reset()
+        return None, 0, engine.nodes
+    return move, score, engine.nodes
+
+
+class ParallelSearch:
+    tableMegabytes = 16
+
+    def __init__(self, bitboard: Bitboard, thrones: tuple, timeBudget: float = None, maxDepth: int = None,
+                 workers: int = None):
+        self.engine = SearchEngine(bitboard, thrones, timeBudget, maxDepth)
+        self.bitboard = bitboard
+        self.thrones = thrones
+        self.workers = workers or os.cpu_count() or 1
+        self.stopEvent = multiprocessing.Event()
+        # stop() sets both, stopEvent is the signal the workers see
+        self.stopped = False
+        self.executor = None
+        # of the running iteration, close() cancels those not started yet
+        self.futures = []
+
+        self.nodes = 0
+        self.elapsed = 0.0
+        self.depth = 0
+        self.score = 0
+
+    def start_executor(self):
+        self.executor = ProcessPoolExecutor(
+            self.workers, initializer=search_worker_init,
+            initargs=(self.bitboard.layout(), self.thrones, self.tableMegabytes, self.stopEvent))
+
+    def close(self):
+        if self.executor is not None:
+            self.stopEvent.set()
+            # shutdown(cancel_futures=True) needs Python 3.9
+            for future in self.futures:
+                future.cancel()
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+    def stop(self):
+        self.stopped = True
+        self.stopEvent.set()
+
+    def nodes_per_second(self) -> float:
+        if not self.elapsed:
+            return 0.0
+        return self.nodes / self.elapsed
+
+    def report(self) -> str:
+        return "depth {} score {} nodes {} time {:.3f}s nps {:.0f} workers {}".format(
+            self.depth, self.score, self.nodes, self.elapsed, self.nodes_per_second(), self.workers)
+
+    def search(self, color: int):
+        startTime = time.perf_counter()
+        deadline = time.time() + self.engine.timeBudget
+        self.stopEvent.clear()
+        if self.stopped:
+            self.stopEvent.set()
+        self.nodes = 0
+        self.depth = 0
+        self.score = 0
+        if self.executor is None:
+            self.start_executor()
+        engine = self.engine
+        engine.threats.reset()
+        bestMove = None
+        moves = engine.root_moves(color)
+        if len(moves) == 1 and moves[0][1] == self.thrones[color]:
+            bestMove = moves[0]
+            self.score = engine.winScore
+        elif moves:
+            bestMove = moves[0]
+            state = self.bitboard.state()
+            for depth in range(1, engine.maxDepth + 1):
+                # round-robin split keeps the best moves from the previous iteration spread over the workers
+                chunks = [moves[i::self.workers] for i in range(min(self.workers, len(moves)))]
+                futures = self.futures = [self.executor.submit(search_worker, state, color, chunk, depth, deadline)
+                                          for chunk in chunks]
+                done, notDone = wait(futures, timeout=max(0.0, deadline - time.time()) + 0.1)
+                if notDone:
+                    self.stopEvent.set()
+                    wait(notDone)
+                results = [future.result() for future in futures]
+                self.nodes += sum(nodes for move, score, nodes in results)
+                if self.stopEvent.is_set() or any(move is None for move, score, nodes in results):
+                    break
+                move, score, nodes = max(results, key=lambda result: result[1])
+                bestMove, self.depth, self.score = move, depth, score
+                if abs(score) >= engine.winScore - engine.maxDepth:
+                    break
+                moves = engine.root_moves(color, bestMove)
+            self.futures = []
+        self.elapsed = time.perf_counter() - startTime
+        return bestMove
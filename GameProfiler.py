@@ -0,0 +1,178 @@
+import collections
+import cProfile
+import csv
+import json
+import pstats
+import time
+
+import pygame
+
+from GameMenu import FunContainer
+
+
+class FrameProfiler:
+    # per frame: time of the event handling, scene update, computer player and rendering phases plus counters;
+    # nothing is recorded unless recording is set
+    phases = ("events", "update", "ai", "render")
+    counters = ("validMoves", "sprites", "rects")
+    historyLength = 1800
+    # "cProfile" or "pyinstrument"
+    captureTool = "cProfile"
+
+    def __init__(self):
+        self.recording = False
+        # (start, phase times..., counters...) of the last frames
+        self.frames = collections.deque(maxlen=self.historyLength)
+        self.frameStart = 0.0
+        self.lastMark = 0.0
+        self.times = dict.fromkeys(self.phases, 0.0)
+        self.counts = dict.fromkeys(self.counters, 0)
+        self.capture = None
+
+    def begin_frame(self):
+        if self.recording:
+            self.frameStart = self.lastMark = time.perf_counter()
+            for phase in self.phases:
+                self.times[phase] = 0.0
+            for counter in self.counters:
+                self.counts[counter] = 0
+
+    def mark(self, phase: str):
+        # the time since the previous mark goes to phase
+        if self.recording:
+            now = time.perf_counter()
+            self.times[phase] += now - self.lastMark
+            self.lastMark = now
+
+    def count(self, counter: str, value: int = 1):
+        if self.recording:
+            self.counts[counter] += value
+
+    def end_frame(self):
+        if self.recording:
+            self.frames.append((self.frameStart, *(self.times[phase] for phase in self.phases),
+                                *(self.counts[counter] for counter in self.counters)))
+
+    def summary(self, numOfFrames: int = 30) -> dict:
+        # averages of the last frames, times in milliseconds
+        frames = list(self.frames)[-numOfFrames:]
+        summary = {"frames": len(frames), "total": 0.0, "max": 0.0}
+        if not frames:
+            return summary
+        numOfPhases = len(self.phases)
+        for i, phase in enumerate(self.phases):
+            summary[phase] = 1000 * sum(frame[1 + i] for frame in frames) / len(frames)
+        for i, counter in enumerate(self.counters):
+            summary[counter] = sum(frame[1 + numOfPhases + i] for frame in frames) / len(frames)
+        totals = [sum(frame[1:1 + numOfPhases]) for frame in frames]
+        summary["total"] = 1000 * sum(totals) / len(frames)
+        summary["max"] = 1000 * max(totals)
+        return summary
+
+    def dump_csv(self, path: str):
+        numOfPhases = len(self.phases)
+        with open(path, "w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(("start", *self.phases, "total", *self.counters))
+            for frame in self.frames:
+                times = frame[1:1 + numOfPhases]
+                writer.writerow(("{:.6f}".format(frame[0]), *("{:.3f}".format(1000 * t) for t in times),
+                                 "{:.3f}".format(1000 * sum(times)), *frame[1 + numOfPhases:]))
+
+    def dump_trace(self, path: str):
+        # Chrome trace event format, open in chrome://tracing or Perfetto
+        numOfPhases = len(self.phases)
+        events = []
+        for frame in self.frames:
+            timestamp = 1e6 * frame[0]
+            for phase, duration in zip(self.phases, frame[1:1 + numOfPhases]):
+                if duration:
+                    events.append({"name": phase, "ph": "X", "ts": timestamp, "dur": 1e6 * duration, "pid": 0, "tid": 0})
+                timestamp += 1e6 * duration
+            events.append({"name": "counters", "ph": "C", "ts": 1e6 * frame[0], "pid": 0,
+                           "args": dict(zip(self.counters, frame[1 + numOfPhases:]))})
+        with open(path, "w") as file:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, file)
+
+    def dump(self) -> tuple:
+        name = time.strftime("frames-%Y%m%d-%H%M%S")
+        self.dump_csv(name + ".csv")
+        self.dump_trace(name + ".trace.json")
+        return name + ".csv", name + ".trace.json"
+
+    def capturing(self) -> bool:
+        return self.capture is not None
+
+    def start_capture(self):
+        # only the thread of the event loop is profiled, the search thread is not
+        if self.captureTool == "pyinstrument":
+            try:
+                import pyinstrument
+            except ImportError:
+                print("Warning, pyinstrument is not installed, using cProfile")
+            else:
+                self.capture = pyinstrument.Profiler()
+                self.capture.start()
+                return
+        self.capture = cProfile.Profile()
+        self.capture.enable()
+
+    def stop_capture(self) -> str:
+        capture = self.capture
+        self.capture = None
+        name = time.strftime("profile-%Y%m%d-%H%M%S")
+        if isinstance(capture, cProfile.Profile):
+            capture.disable()
+            capture.dump_stats(name + ".prof")
+            pstats.Stats(capture).sort_stats("cumulative").print_stats(15)
+            return name + ".prof"
+        capture.stop()
+        with open(name + ".html", "w") as file:
+            file.write(capture.output_html())
+        print(capture.output_text())
+        return name + ".html"
+
+
+class ProfilerOverlay:
+    # drawn straight on the screen above the scene after every frame while visible, opaque and of a fixed size
+    # so that it always covers what it drew before
+    position = (10, 30)
+    size = (440, 76)
+    fontSize = 16
+    textColor = (255, 255, 255)
+    backgroundColor = (0, 0, 0)
+    refreshFrames = 10
+
+    def __init__(self, profiler: FrameProfiler):
+        self.profiler = profiler
+        self.visible = False
+        self.image = None
+        self.rect = None
+        self.age = 0
+
+    def render(self):
+        summary = self.profiler.summary()
+        lines = ["frame {:.2f}ms avg {:.2f}ms max over {} frames".format(summary["total"], summary["max"], summary["frames"])]
+        if summary["frames"]:
+            lines.append("  ".join("{} {:.2f}".format(phase, summary[phase]) for phase in self.profiler.phases))
+            lines.append("  ".join("{} {:.1f}".format(counter, summary[counter]) for counter in self.profiler.counters))
+        if self.profiler.capturing():
+            lines.append("capturing {}".format(self.profiler.captureTool))
+        font = FunContainer.font(self.fontSize)
+        if self.image is None:
+            self.image = pygame.Surface(self.size)
+            self.rect = self.image.get_rect(topleft=self.position)
+        self.image.fill(self.backgroundColor)
+        top = 4
+        for line in lines:
+            image = font.render(line, 1, self.textColor)
+            self.image.blit(image, (4, top))
+            top += image.get_height()
+
+    def draw(self, screen: pygame.Surface):
+        if self.image is None or self.age >= self.refreshFrames:
+            self.render()
+            self.age = 0
+        self.age += 1
+        screen.blit(self.image, self.rect)
+        pygame.display.update(self.rect)
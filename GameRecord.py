@@ -0,0 +1,96 @@
+import mmap
+import os
+import struct
+
+
+class GameRecordError(Exception):
+    pass
+
+
+class GameRecord:
+    # little-endian layout: header, white stones, black stones (one bit per cell), history as (start, end) cell pairs
+    magic = b"CSTL"
+    version = 1
+    header = struct.Struct("<4sBBBBHHI")
+
+    def __init__(self, numOfCells: int, stones: tuple, activeColor: int, player1Color: int, thrones: tuple,
+                 history: list):
+        self.numOfCells = numOfCells
+        self.stones = stones
+        self.activeColor = activeColor
+        self.player1Color = player1Color
+        self.thrones = thrones
+        self.history = history
+
+    @classmethod
+    def stone_bytes(cls, numOfCells: int) -> int:
+        return (numOfCells * numOfCells + 7) // 8
+
+    @classmethod
+    def from_model(cls, gameModel) -> "GameRecord":
+        bitboard = gameModel.bitboard
+        thrones = (bitboard.cell(gameModel.player1ThronePos), bitboard.cell(gameModel.player2ThronePos))
+        return cls(gameModel.numOfCells, tuple(bitboard.stones), gameModel.activePlayer.color.value,
+                   gameModel.player1.color.value, thrones, list(gameModel.history))
+
+    def size(self) -> int:
+        return self.header.size + 2 * self.stone_bytes(self.numOfCells) + 4 * len(self.history)
+
+    def pack_into(self, buffer, offset: int = 0) -> int:
+        stoneBytes = self.stone_bytes(self.numOfCells)
+        self.header.pack_into(buffer, offset, self.magic, self.version, self.numOfCells, self.activeColor,
+                              self.player1Color, self.thrones[0], self.thrones[1], len(self.history))
+        offset += self.header.size
+        for stones in self.stones:
+            buffer[offset:offset + stoneBytes] = stones.to_bytes(stoneBytes, "little")
+            offset += stoneBytes
+        cells = [cell for move in self.history for cell in move]
+        struct.pack_into("<{}H".format(len(cells)), buffer, offset, *cells)
+        return offset + 2 * len(cells)
+
+    @classmethod
+    def unpack_from(cls, buffer, offset: int = 0) -> tuple:
+        # returns the record and the offset just behind it
+        if len(buffer) - offset < cls.header.size:
+            raise GameRecordError("Truncated game record")
+        magic, version, numOfCells, activeColor, player1Color, throne1, throne2, numOfMoves = \
+            cls.header.unpack_from(buffer, offset)
+        if magic != cls.magic:
+            raise GameRecordError("Not a saved game")
+        if version != cls.version:
+            raise GameRecordError("Unsupported saved game version {}".format(version))
+        offset += cls.header.size
+        stoneBytes = cls.stone_bytes(numOfCells)
+        end = offset + 2 * stoneBytes + 4 * numOfMoves
+        if len(buffer) < end:
+            raise GameRecordError("Truncated game record")
+        stones = []
+        for color in range(2):
+            stones.append(int.from_bytes(buffer[offset:offset + stoneBytes], "little"))
+            offset += stoneBytes
+        cells = struct.unpack_from("<{}H".format(2 * numOfMoves), buffer, offset)
+        history = list(zip(cells[0::2], cells[1::2]))
+        record = cls(numOfCells, tuple(stones), activeColor, player1Color, (throne1, throne2), history)
+        return record, end
+
+    def save(self, path: str):
+        size = self.size()
+        with open(path, "w+b") as file:
+            file.truncate(size)
+            with mmap.mmap(file.fileno(), size) as buffer:
+                self.pack_into(buffer)
+
+    @classmethod
+    def load(cls, path: str) -> "GameRecord":
+        if not os.path.getsize(path):
+            raise GameRecordError("Empty saved game")
+        with open(path, "rb") as file:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                return cls.unpack_from(buffer)[0]
+
+    def apply(self, gameModel):
+        bitboard = gameModel.bitboard
+        if self.numOfCells != gameModel.numOfCells or \
+                self.thrones != (bitboard.cell(gameModel.player1ThronePos), bitboard.cell(gameModel.player2ThronePos)):
+            raise GameRecordError("Saved game was played on a different board")
+        gameModel.set_position(self.stones, self.activeColor, self.history, self.player1Color)
@@ -0,0 +1,244 @@
+import time
+
+from GameBitboard import Bitboard
+from GameThreats import ThreatMap
+from GameTransposition import TranspositionTable
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+class SearchEngine:
+    winScore = 100000
+    materialWeight = 100
+    distanceWeight = 10
+    captureBonus = 1000
+    maxDepth = 64
+    timeBudget = 1.0
+    nodesBetweenClockChecks = 1024
+
+    def __init__(self, bitboard: Bitboard, thrones: tuple, timeBudget: float = None, maxDepth: int = None,
+                 table: TranspositionTable = None):
+        # thrones[color] is the cell a stone of that color has to reach to win
+        self.bitboard = bitboard
+        self.thrones = thrones
+        self.table = table
+        if timeBudget is not None:
+            self.timeBudget = timeBudget
+        if maxDepth is not None:
+            self.maxDepth = maxDepth
+        self.distances = tuple(self.distances_init(throne) for throne in thrones)
+        # moves come from the slides kept by the threat map, anyone changing the bitboard outside the search
+        # has to reset it
+        self.threats = ThreatMap(bitboard, thrones)
+        self.maxDistance = 2 * bitboard.numOfCells
+
+        self.deadline = None
+        self.stopEvent = None
+        self.stopped = False
+        self.nodes = 0
+        self.elapsed = 0.0
+        self.depth = 0
+        self.score = 0
+
+    def distances_init(self, throne: int) -> tuple:
+        throneRow, throneColumn = self.bitboard.positions[throne]
+        return tuple(abs(row - throneRow) + abs(column - throneColumn) for row, column in self.bitboard.positions)
+
+    def out_of_time(self) -> bool:
+        if self.stopped:
+            return True
+        if self.stopEvent is not None and self.stopEvent.is_set():
+            return True
+        return time.perf_counter() > self.deadline
+
+    def stop(self):
+        self.stopped = True
+
+    def nodes_per_second(self) -> float:
+        if not self.elapsed:
+            return 0.0
+        return self.nodes / self.elapsed
+
+    def report(self) -> str:
+        report = "depth {} score {} nodes {} time {:.3f}s nps {:.0f}".format(
+            self.depth, self.score, self.nodes, self.elapsed, self.nodes_per_second())
+        if self.table is not None:
+            report += ", " + self.table.report()
+        return report
+
+    def score_to_table(self, score: int, ply: int) -> int:
+        # win scores are stored relative to the node rather than to the root
+        if score >= self.winScore - self.maxDepth:
+            return score + ply
+        if score <= self.maxDepth - self.winScore:
+            return score - ply
+        return score
+
+    def score_from_table(self, score: int, ply: int) -> int:
+        if score >= self.winScore - self.maxDepth:
+            return score - ply
+        if score <= self.maxDepth - self.winScore:
+            return score + ply
+        return score
+
+    def side_score(self, color: int) -> int:
+        stones = self.bitboard.stones[color]
+        distance = self.distances[color]
+        nearest = self.maxDistance
+        count = 0
+        while stones:
+            bit = stones & -stones
+            stones ^= bit
+            count += 1
+            cellDistance = distance[bit.bit_length() - 1]
+            if cellDistance < nearest:
+                nearest = cellDistance
+        return count * self.materialWeight - nearest * self.distanceWeight
+
+    def evaluate(self, color: int) -> int:
+        return self.side_score(color) - self.side_score(1 - color)
+
+    def ordered_moves(self, color: int, firstMove: tuple = None) -> list:
+        # winning moves first, then captures, then moves towards the opponent throne
+        opponents = self.bitboard.stones[1 - color]
+        distance = self.distances[color]
+        throne = self.thrones[color]
+        moves = []
+        for start, end in self.threats.legal_moves(color):
+            if end == throne:
+                return [(start, end)]
+            key = distance[start] - distance[end]
+            if opponents >> end & 1:
+                key += self.captureBonus
+            if firstMove is not None and (start, end) == firstMove:
+                key += 2 * self.captureBonus
+            moves.append((key, start, end))
+        moves.sort(reverse=True)
+        return [(start, end) for key, start, end in moves]
+
+    def negamax(self, color: int, depth: int, alpha: int, beta: int, ply: int) -> int:
+        self.nodes += 1
+        if not self.nodes % self.nodesBetweenClockChecks and self.out_of_time():
+            raise SearchTimeout
+        if depth == 0:
+            return self.evaluate(color)
+        threats = self.threats
+        if threats.throne_threats(color):
+            return self.winScore - ply
+        bitboard = self.bitboard
+        table = self.table
+        tableMove = None
+        if table is not None:
+            key = bitboard.hash ^ bitboard.sideKeys[color]
+            slot = table.probe(key)
+            if slot >= 0:
+                if table.moves[slot] >= 0:
+                    tableMove = divmod(table.moves[slot], bitboard.numOfBits)
+                if table.depths[slot] >= depth:
+                    score = self.score_from_table(table.scores[slot], ply)
+                    bound = table.bounds[slot]
+                    if bound == table.EXACT:
+                        return score
+                    if bound == table.LOWER and score >= beta:
+                        return score
+                    if bound == table.UPPER and score <= alpha:
+                        return score
+        moves = self.ordered_moves(color, tableMove)
+        if not moves:
+            return 0
+        # against a stone that reaches our throne next move only capturing it or blocking its way helps
+        defences = threats.defences(color)
+        if defences >= 0:
+            moves = [move for move in moves if defences >> move[1] & 1]
+            if not moves:
+                return ply + 1 - self.winScore
+        originalAlpha = alpha
+        bestScore = -self.winScore - 1
+        bestMove = moves[0]
+        # leaves only evaluate, the threat map does not have to follow the moves into them
+        track = depth > 1
+        for start, end in moves:
+            captured = bitboard.move(color, start, end)
+            if track:
+                threats.push(start, end)
+            score = -self.negamax(1 - color, depth - 1, -beta, -alpha, ply + 1)
+            bitboard.unmake(color, start, end, captured)
+            if track:
+                threats.pop()
+            if score > bestScore:
+                bestScore = score
+                bestMove = (start, end)
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        break
+        if table is not None:
+            if bestScore >= beta:
+                bound = table.LOWER
+            elif bestScore <= originalAlpha:
+                bound = table.UPPER
+            else:
+                bound = table.EXACT
+            table.store(key, depth, self.score_to_table(bestScore, ply), bound,
+                        bestMove[0] * bitboard.numOfBits + bestMove[1])
+        return bestScore
+
+    def root_moves(self, color: int, firstMove: tuple = None) -> list:
+        # moves that leave a throne threat standing are dropped unless nothing else is left
+        moves = self.ordered_moves(color, firstMove)
+        defences = self.threats.defences(color)
+        if defences >= 0 and not (len(moves) == 1 and moves[0][1] == self.thrones[color]):
+            moves = [move for move in moves if defences >> move[1] & 1] or moves
+        return moves
+
+    def search_root(self, color: int, depth: int, moves: list) -> tuple:
+        bitboard = self.bitboard
+        threats = self.threats
+        alpha = -self.winScore - 1
+        bestMove = moves[0]
+        track = depth > 1
+        for start, end in moves:
+            captured = bitboard.move(color, start, end)
+            if track:
+                threats.push(start, end)
+            score = -self.negamax(1 - color, depth - 1, -self.winScore - 1, -alpha, 1)
+            bitboard.unmake(color, start, end, captured)
+            if track:
+                threats.pop()
+            if score > alpha:
+                alpha = score
+                bestMove = (start, end)
+        return bestMove, alpha
+
+    def search(self, color: int):
+        startTime = time.perf_counter()
+        self.deadline = startTime + self.timeBudget
+        self.nodes = 0
+        self.depth = 0
+        self.score = 0
+        if self.table is not None:
+            self.table.new_search()
+            self.table.reset_counters()
+        savedState = self.bitboard.state()
+        self.threats.reset()
+        bestMove = None
+        moves = self.root_moves(color)
+        if len(moves) == 1 and moves[0][1] == self.thrones[color]:
+            bestMove = moves[0]
+            self.score = self.winScore
+        elif moves:
+            bestMove = moves[0]
+            try:
+                for depth in range(1, self.maxDepth + 1):
+                    move, score = self.search_root(color, depth, moves)
+                    bestMove, self.depth, self.score = move, depth, score
+                    if abs(score) >= self.winScore - self.maxDepth:
+                        break
+                    moves = self.root_moves(color, bestMove)
+            except SearchTimeout:
+                self.bitboard.set_state(savedState)
+                self.threats.reset()
+        self.elapsed = time.perf_counter() - startTime
+        return bestMove
@@ -0,0 +1,132 @@
+from GameBitboard import Bitboard
+
+
+class ThreatMap:
+    # slide targets of every stone, kept between moves: a move only changes the slides of the stones on the rows and
+    # columns of its start and end cells, so those lines are marked dirty and a query recomputes only the dirty stones
+    # it looks at; thrones[color] is the cell a stone of that color has to reach to win
+    def __init__(self, bitboard: Bitboard, thrones: tuple):
+        self.bitboard = bitboard
+        self.thrones = thrones
+        # row and column of every cell, the cell included
+        self.lines = tuple(rays[0] | rays[1] | rays[2] | rays[3] | 1 << cell for cell, rays in enumerate(bitboard.rays))
+        self.targets = [0] * bitboard.numOfBits
+        self.dirty = bitboard.fullMask
+        # (dirty, length of saved) for every pushed move and the (cell, targets) overwritten since,
+        # so that pop() brings the map back to the position before the move
+        self.pushed = []
+        self.saved = []
+        self.refreshes = 0
+
+    def reset(self):
+        # after the bitboard was changed behind the map's back
+        self.dirty = self.bitboard.fullMask
+        self.pushed.clear()
+        self.saved.clear()
+
+    def touch(self, start: int, end: int):
+        # after a move or an unmake played outside push() and pop()
+        self.dirty |= self.lines[start] | self.lines[end]
+
+    def push(self, start: int, end: int):
+        # after a move of a search, pop() follows its unmake
+        self.pushed.append((self.dirty, len(self.saved)))
+        self.dirty |= self.lines[start] | self.lines[end]
+
+    def pop(self):
+        dirty, mark = self.pushed.pop()
+        saved = self.saved
+        targets = self.targets
+        while len(saved) > mark:
+            cell, cellTargets = saved.pop()
+            targets[cell] = cellTargets
+        self.dirty = dirty
+
+    def refresh(self, color: int, stones: int):
+        # recomputes the dirty ones of stones, all of color
+        stones &= self.dirty
+        if not stones:
+            return
+        self.dirty ^= stones
+        bitboard = self.bitboard
+        targets = self.targets
+        saved = self.saved if self.pushed else None
+        while stones:
+            bit = stones & -stones
+            stones ^= bit
+            cell = bit.bit_length() - 1
+            if saved is not None:
+                saved.append((cell, targets[cell]))
+            targets[cell] = bitboard.targets(cell, color)
+            self.refreshes += 1
+
+    def legal_moves(self, color: int):
+        # the same moves as Bitboard.legal_moves
+        stones = self.bitboard.stones[color]
+        self.refresh(color, stones)
+        targets = self.targets
+        while stones:
+            startBit = stones & -stones
+            stones ^= startBit
+            start = startBit.bit_length() - 1
+            ends = targets[start]
+            while ends:
+                endBit = ends & -ends
+                ends ^= endBit
+                yield start, endBit.bit_length() - 1
+
+    def attacks(self, color: int) -> int:
+        # cells the stones of color can move to
+        stones = self.bitboard.stones[color]
+        self.refresh(color, stones)
+        targets = self.targets
+        attacks = 0
+        while stones:
+            bit = stones & -stones
+            stones ^= bit
+            attacks |= targets[bit.bit_length() - 1]
+        return attacks
+
+    def throne_threats(self, color: int) -> int:
+        # stones of color that reach their throne in one slide, only those on its row or column can
+        throne = self.thrones[color]
+        stones = self.bitboard.stones[color] & self.lines[throne]
+        if not stones:
+            return 0
+        self.refresh(color, stones)
+        targets = self.targets
+        threats = 0
+        while stones:
+            bit = stones & -stones
+            stones ^= bit
+            if targets[bit.bit_length() - 1] >> throne & 1:
+                threats |= bit
+        return threats
+
+    def en_prise(self, color: int) -> int:
+        # stones of color the other side can capture
+        return self.bitboard.stones[color] & self.attacks(1 - color)
+
+    def winning_move(self, color: int):
+        threats = self.throne_threats(color)
+        if not threats:
+            return None
+        return (threats & -threats).bit_length() - 1, self.thrones[color]
+
+    def defences(self, color: int) -> int:
+        # cells where a move of color has to end to stop every throne threat of the other side: the threatening
+        # stones and the cells between them and the throne; -1 when there is no threat
+        threats = self.throne_threats(1 - color)
+        if not threats:
+            return -1
+        bitboard = self.bitboard
+        throne = self.thrones[1 - color]
+        rays = bitboard.rays
+        defences = 0
+        while threats:
+            bit = threats & -threats
+            threats ^= bit
+            start = bit.bit_length() - 1
+            direction = bitboard.direction(start, throne)
+            defences |= bit | (rays[start][direction] ^ rays[throne][direction] ^ 1 << throne)
+        return defences
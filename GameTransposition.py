@@ -0,0 +1,97 @@
+from array import array
+
+
+class TranspositionTable:
+    EXACT = 0
+    LOWER = 1
+    UPPER = 2
+
+    # key, score, move, depth, bound and age of one slot
+    slotSize = 8 + 4 + 4 + 1 + 1 + 1
+
+    def __init__(self, megabytes: float = 16):
+        # every bucket has a depth-preferred slot followed by an always-replace slot
+        self.numOfBuckets = max(1, int(megabytes * 1024 * 1024) // (2 * self.slotSize))
+        self.keys = None
+        self.scores = None
+        self.moves = None
+        self.depths = None
+        self.bounds = None
+        self.ages = None
+        self.age = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.collisions = 0
+        self.stores = 0
+        self.clear()
+
+    def clear(self):
+        numOfSlots = 2 * self.numOfBuckets
+        self.keys = array("Q", bytes(8 * numOfSlots))
+        self.scores = array("i", bytes(4 * numOfSlots))
+        self.moves = array("i", [-1]) * numOfSlots
+        self.depths = array("b", bytes(numOfSlots))
+        self.bounds = array("b", bytes(numOfSlots))
+        self.ages = array("B", bytes(numOfSlots))
+        self.age = 0
+        self.reset_counters()
+
+    def reset_counters(self):
+        self.hits = 0
+        self.misses = 0
+        self.collisions = 0
+        self.stores = 0
+
+    def new_search(self):
+        self.age = (self.age + 1) & 0xFF
+
+    def probe(self, key: int) -> int:
+        slot = 2 * (key % self.numOfBuckets)
+        keys = self.keys
+        if keys[slot] == key:
+            self.hits += 1
+            return slot
+        if keys[slot + 1] == key:
+            self.hits += 1
+            return slot + 1
+        if keys[slot] or keys[slot + 1]:
+            self.collisions += 1
+        self.misses += 1
+        return -1
+
+    def store(self, key: int, depth: int, score: int, bound: int, move: int):
+        slot = 2 * (key % self.numOfBuckets)
+        keys = self.keys
+        depths = self.depths
+        self.stores += 1
+        if keys[slot] and keys[slot] != key:
+            if depth >= depths[slot] or self.ages[slot] != self.age:
+                self.copy_slot(slot, slot + 1)
+            else:
+                slot += 1
+        if keys[slot] == key and move < 0:
+            move = self.moves[slot]
+        keys[slot] = key
+        self.scores[slot] = score
+        self.moves[slot] = move
+        depths[slot] = depth
+        self.bounds[slot] = bound
+        self.ages[slot] = self.age
+
+    def copy_slot(self, source: int, destination: int):
+        self.keys[destination] = self.keys[source]
+        self.scores[destination] = self.scores[source]
+        self.moves[destination] = self.moves[source]
+        self.depths[destination] = self.depths[source]
+        self.bounds[destination] = self.bounds[source]
+        self.ages[destination] = self.ages[source]
+
+    def memory_size(self) -> int:
+        return len(self.keys) * self.slotSize
+
+    def report(self) -> str:
+        probes = self.hits + self.misses
+        hitRate = self.hits / probes if probes else 0.0
+        return "tt hits {} misses {} collisions {} stores {} hit rate {:.1%}".format(
+            self.hits, self.misses, self.collisions, self.stores, hitRate)
@@ -1,10 +1,10 @@
 import pygame
 from pygame.locals import *
 
-import pickle
-
 from GameModel import *
 from GameMenu import *
+from GameGeometry import BoardGeometry
+from GameEvents import MoveEvent, CaptureEvent, UnmakeEvent
 
 if not pygame.font:
     print("Warning, fonts disabled")
@@ -12,35 +12,36 @@ if not pygame.mixer:
     print("Warning, sound disabled")
 
 
-class Ball(pygame.sprite.Sprite):
+class Ball(pygame.sprite.DirtySprite):
     resolution = (35, 35)
     color = None
 
-    def __init__(self):
+    def __init__(self, resolution: tuple = None):
         super().__init__()
+        if resolution is not None:
+            self.resolution = resolution
         self.image = None
         self.rect = None
 
     def on_init(self):
-        self.image = pygame.transform.scale(self.image, (self.resolution[0], self.resolution[1]))
         self.rect = self.image.get_rect()
 
 
 class WhiteBall(Ball):
     color = GameColor.WHITE
 
-    def __init__(self):
-        super().__init__()
-        self.image = FunContainer.load_image("white-ball.jpg", -1)
+    def __init__(self, resolution: tuple = None):
+        super().__init__(resolution)
+        self.image = FunContainer.image("white-ball.jpg", self.resolution, -1)
         self.on_init()
 
 
 class BlackBall(Ball):
     color = GameColor.BLACK
 
-    def __init__(self):
-        super().__init__()
-        self.image = FunContainer.load_image("black-ball.jpg", -1)
+    def __init__(self, resolution: tuple = None):
+        super().__init__(resolution)
+        self.image = FunContainer.image("black-ball.jpg", self.resolution, -1)
         self.on_init()
 
 
@@ -50,37 +51,103 @@ class BallsContainer(pygame.sprite.RenderPlain):
         self.ballsList = ballsList
 
 
+class ThinkingIndicator(pygame.sprite.DirtySprite):
+    text = "Thinking"
+    size = 30
+    maxDots = 3
+    framesPerDot = 8
+
+    def __init__(self, position: Rect):
+        super().__init__()
+        self.images = [FunContainer.font_render(self.text + "." * dots, self.size) for dots in range(self.maxDots + 1)]
+        self.image = self.images[0]
+        self.rect = self.images[-1].get_rect()
+        self.rect.topleft = position.topleft
+        self.frame = 0
+        self.visible = 0
+
+    def update(self):
+        self.frame += 1
+        image = self.images[(self.frame // self.framesPerDot) % len(self.images)]
+        if image is not self.image:
+            self.image = image
+            self.dirty = 1
+
+
+class ThreatMarker(pygame.sprite.DirtySprite):
+    def __init__(self, image: pygame.Surface, center: tuple):
+        super().__init__()
+        self.image = image
+        self.rect = image.get_rect()
+        self.rect.center = center
+
+
 class GameView:
+    ballsLayer = 0
+    markersLayer = 1
+    indicatorLayer = 2
+    cursorLayer = 3
+
     windowWidth = GameMenu.windowWidth
     windowHeight = GameMenu.windowHeight
     marginWidth = 10
     marginHeight = 10
 
-    numOfCells = GameModel.numOfCells
+    # image sizes for the cell size of the classic 19x19 board, scaled for other boards
+    classicCellSize = 41
+    ballResolution = Ball.resolution
+    throneResolution = (60, 60)
+    wallResolution = (42, 42)
 
-    cellWidth = np.floor_divide(windowWidth-2*marginWidth, numOfCells)
-    marginWidth += np.floor_divide(np.remainder(windowWidth-2*marginWidth, numOfCells), 2)
-    cellHeight = np.floor_divide(windowHeight-2*marginHeight, numOfCells)
-    marginHeight += np.floor_divide(np.remainder(windowHeight-2*marginHeight, numOfCells), 2)
     linesColor = (25, 25, 110)
 
+    # rings around the stones that reach a throne and around the stones of the player to move that can be captured,
+    # toggled with T
+    showThreats = True
+    throneThreatColor = (220, 30, 30)
+    captureThreatColor = (255, 150, 0)
+    markerWidth = 3
+
     def __init__(self, screen: pygame.Surface, gameModel: GameModel):
         super().__init__()
         self.gameModel = gameModel
-
-        self.board = self.board_init()
+        self.numOfCells = gameModel.numOfCells
+
+        self.geometry = BoardGeometry(self.numOfCells, self.windowWidth, self.windowHeight,
+                                      self.marginWidth, self.marginHeight)
+        self.ballResolution = self.scaled(self.ballResolution)
+        self.throneResolution = self.scaled(self.throneResolution)
+        self.wallResolution = self.scaled(self.wallResolution)
+        self.markerWidth = self.scaled((self.markerWidth,))[0]
         self.screen = screen
 
-        self.background = FunContainer.load_image("background.jpg")
-        self.background = pygame.transform.scale(self.background, (self.windowWidth, self.windowHeight))
+        # a copy, the lines, thrones and walls are drawn on it
+        self.background = FunContainer.image("background.jpg", (self.windowWidth, self.windowHeight)).copy()
         self.draw_lines()
         self.draw_thrones()
         self.draw_walls()
 
         self.gauntlet = None
+        self.profiler = None
+        self.thinkingIndicator = ThinkingIndicator(Rect(self.geometry.marginWidth, 0, 0, 0))
+        self.thinking = False
+        self.throneMarkerImage = self.marker_image(self.throneThreatColor)
+        self.captureMarkerImage = self.marker_image(self.captureThreatColor)
+        # board cell -> marker, redone when the position or the player to move changes
+        self.threatMarkers = {}
+        self.threatsKey = None
+
+        # everything drawn on the board goes through one group that only repaints changed areas
+        self.allSprites = pygame.sprite.LayeredDirty()
+        self.allSprites.add(self.thinkingIndicator, layer=self.indicatorLayer)
 
         self.blackBalls = None
         self.whiteBalls = None
+        # board cell -> ball sprite standing on it, kept in step with the model through its events
+        self.cellSprites = {}
+        self.gameModel.subscribe(MoveEvent, self.ball_moved)
+        self.gameModel.subscribe(CaptureEvent, self.ball_captured)
+        self.gameModel.subscribe(UnmakeEvent, self.ball_unmade)
 
         self.balls_init()
         self.init_draw()
@@ -94,96 +161,144 @@ class GameView:
             whiteBalls = self.gameModel.player1.balls
         self.blackBalls = BallsContainer(blackBalls)
         self.whiteBalls = BallsContainer(whiteBalls)
-        for position in self.blackBalls.ballsList:
-            blackBall = BlackBall()
-            blackBall.rect.center = Rect(self.board[position]).center
-            self.blackBalls.add(blackBall)
-        for position in self.whiteBalls.ballsList:
-            whiteBall = WhiteBall()
-            whiteBall.rect.center = Rect(self.board[position]).center
-            self.whiteBalls.add(whiteBall)
-
-    def balls_update(self):
-        activeColor = self.gameModel.activePlayer.color
-        if activeColor == GameColor.WHITE:
-            numOfSprites = len(self.blackBalls)
-            numOfBalls = len(self.blackBalls.ballsList)
-            balls = self.whiteBalls
-            opballs = self.blackBalls
+        self.cellSprites = {}
+        positions = self.geometry.positions
+        for cell in self.blackBalls.ballsList:
+            self.add_ball(GameColor.BLACK, positions[cell])
+        for cell in self.whiteBalls.ballsList:
+            self.add_ball(GameColor.WHITE, positions[cell])
+
+    def add_ball(self, color: GameColor, position: tuple):
+        if color == GameColor.BLACK:
+            ball = BlackBall(self.ballResolution)
+            self.blackBalls.add(ball)
         else:
-            numOfSprites = len(self.whiteBalls)
-            numOfBalls = len(self.whiteBalls.ballsList)
-            balls = self.blackBalls
-            opballs = self.whiteBalls
-        if numOfBalls != numOfSprites:
-            opballs.sprites()[0].kill()
-        for i in range(len(balls)):
-            balls.sprites()[i].rect.center = Rect(self.board[balls.ballsList[i]]).center
+            ball = WhiteBall(self.ballResolution)
+            self.whiteBalls.add(ball)
+        ball.rect.center = self.geometry.center(position)
+        self.allSprites.add(ball, layer=self.ballsLayer)
+        self.cellSprites[self.geometry.cell(position)] = ball
+
+    def balls_reset(self):
+        for ball in self.blackBalls.sprites() + self.whiteBalls.sprites():
+            ball.kill()
+        self.balls_init()
+        self.threats_update()
+        self.init_draw()
+
+    def ball_moved(self, event: MoveEvent):
+        endCell = self.geometry.cell(event.endPos)
+        ball = self.cellSprites.pop(self.geometry.cell(event.startPos))
+        self.cellSprites[endCell] = ball
+        ball.rect.center = self.geometry.centers[endCell]
+        ball.dirty = 1
+
+    def ball_captured(self, event: CaptureEvent):
+        # the group repaints the area of a removed sprite on the next draw
+        self.cellSprites.pop(self.geometry.cell(event.position)).kill()
+
+    def ball_unmade(self, event: UnmakeEvent):
+        startCell = self.geometry.cell(event.startPos)
+        ball = self.cellSprites.pop(self.geometry.cell(event.endPos))
+        self.cellSprites[startCell] = ball
+        ball.rect.center = self.geometry.centers[startCell]
+        ball.dirty = 1
+        if event.capturedColor is not None:
+            self.add_ball(event.capturedColor, event.endPos)
+
+    def marker_image(self, color: tuple) -> pygame.Surface:
+        size = self.ballResolution[0] + 2 * self.markerWidth
+        image = pygame.Surface((size, size), SRCALPHA)
+        pygame.draw.circle(image, color, (size // 2, size // 2), size // 2, self.markerWidth)
+        return image
+
+    def threats_update(self):
+        # reads the model's bitboard, not to be called while a search is running on it
+        gameModel = self.gameModel
+        color = gameModel.activePlayer.color
+        # the model builds a new map when the players swap colours
+        key = (gameModel.bitboard.hash, color, gameModel.threats) if self.showThreats else None
+        if key == self.threatsKey:
+            return
+        self.threatsKey = key
+        images = {}
+        if self.showThreats:
+            threats = gameModel.threats
+            # a stone on its way to a throne matters more than one that can be taken
+            for cells, image in ((threats.en_prise(color), self.captureMarkerImage),
+                                 (threats.throne_threats(color) | threats.throne_threats(1 - color),
+                                  self.throneMarkerImage)):
+                while cells:
+                    bit = cells & -cells
+                    cells ^= bit
+                    images[bit.bit_length() - 1] = image
+        for cell, marker in list(self.threatMarkers.items()):
+            if images.get(cell) is not marker.image:
+                marker.kill()
+                del self.threatMarkers[cell]
+        for cell, image in images.items():
+            if cell not in self.threatMarkers:
+                marker = ThreatMarker(image, self.geometry.centers[cell])
+                self.threatMarkers[cell] = marker
+                self.allSprites.add(marker, layer=self.markersLayer)
+
+    def toggle_threats(self):
+        self.showThreats = not self.showThreats
+        if not self.showThreats:
+            self.threats_update()
 
     def init_draw(self):
         self.screen.blit(self.background, (0, 0))
-        self.blackBalls.draw(self.screen)
-        self.whiteBalls.draw(self.screen)
+        self.allSprites.clear(self.screen, self.background)
+        if self.gauntlet is not None and not self.allSprites.has(self.gauntlet):
+            self.allSprites.add(self.gauntlet, layer=self.cursorLayer)
+        for sprite in self.allSprites:
+            sprite.dirty = 1
+        self.allSprites.draw(self.screen)
+        pygame.display.update()
 
-    def board_init(self):
-        board = np.array([[Rect([0]*4)]*self.numOfCells]*self.numOfCells)
-        for i in range(self.numOfCells):
-            for j in range(self.numOfCells):
-                board[j][i] = Rect(i*self.cellWidth+self.marginWidth, j*self.cellHeight+self.marginHeight, self.cellWidth-1, self.cellHeight-1)
-        return board
+    def scaled(self, resolution: tuple) -> tuple:
+        cellSize = min(self.geometry.cellWidth, self.geometry.cellHeight)
+        return tuple(max(1, size * cellSize // self.classicCellSize) for size in resolution)
 
     def cartesian2board(self, pos):
-        x = np.floor_divide(pos[1] - self.marginWidth, self.cellWidth)
-        if x >= self.numOfCells:
-            x = self.numOfCells - 1
-        elif x <= 0:
-            x = 0
-        y = np.floor_divide(pos[0] - self.marginHeight, self.cellHeight)
-        if y >= self.numOfCells:
-            y = self.numOfCells - 1
-        elif y <= 0:
-            y = 0
-        return x, y
+        return self.geometry.position_at(pos)
 
     def draw_lines(self):
+        center = self.geometry.center
         for i in range(self.numOfCells):
-            start = Rect(self.board[i][0]).center
-            stop = Rect(self.board[i][self.numOfCells-1]).center
+            start = center((i, 0))
+            stop = center((i, self.numOfCells-1))
             pygame.draw.line(self.background, self.linesColor, start, stop, 1)
         for j in range(self.numOfCells):
-            start = Rect(self.board[0][j]).center
-            stop = Rect(self.board[self.numOfCells-1][j]).center
+            start = center((0, j))
+            stop = center((self.numOfCells-1, j))
             pygame.draw.line(self.background, self.linesColor, start, stop, 1)
 
     def draw_thrones(self):
-        resolution = (60, 60)
-        blueThrone = FunContainer.load_image("blue-throne.jpg", -1)
-        redThrone = FunContainer.load_image("red-throne.jpg", -1)
-        blueThrone = pygame.transform.scale(blueThrone, resolution)
-        redThrone = pygame.transform.scale(redThrone, resolution)
-        FunContainer.center_blit(self.background, blueThrone, Rect(self.board[self.gameModel.player1ThronePos]))
-        FunContainer.center_blit(self.background, redThrone, Rect(self.board[self.gameModel.player2ThronePos]))
+        blueThrone = FunContainer.image("blue-throne.jpg", self.throneResolution, -1)
+        redThrone = FunContainer.image("red-throne.jpg", self.throneResolution, -1)
+        FunContainer.center_blit(self.background, blueThrone, Rect(self.geometry.rect(self.gameModel.player1ThronePos)))
+        FunContainer.center_blit(self.background, redThrone, Rect(self.geometry.rect(self.gameModel.player2ThronePos)))
 
     def draw_walls(self):
-        resolution = (42, 42)
-        wallImage = FunContainer.load_image("wall.jpg")
-        wallImage = pygame.transform.scale(wallImage, resolution)
-        for i in range(self.numOfCells):
-            for j in range(self.numOfCells):
-                if self.gameModel.wallsMap[i][j]:
-                    FunContainer.center_blit(self.background, wallImage, Rect(self.board[(i, j)]))
+        wallImage = FunContainer.image("wall.jpg", self.wallResolution)
+        for cell in range(self.numOfCells * self.numOfCells):
+            if self.gameModel.layout.wallsMask >> cell & 1:
+                FunContainer.center_blit(self.background, wallImage, Rect(self.geometry.rects[cell]))
 
     def view_update(self):
-        self.screen.blit(self.background, self.gauntlet.rect, self.gauntlet.rect)
-
-        self.blackBalls.clear(self.screen, self.background)
-        self.blackBalls.draw(self.screen)
-
-        self.whiteBalls.clear(self.screen, self.background)
-        self.whiteBalls.draw(self.screen)
-
         self.gauntlet.update()
-        self.screen.blit(self.gauntlet.image, self.gauntlet.rect)
-
-        pygame.display.update()
-
+        if not self.thinking:
+            self.threats_update()
+        if self.thinkingIndicator.visible != self.thinking:
+            self.thinkingIndicator.visible = self.thinking
+        if self.thinking:
+            self.thinkingIndicator.update()
+        if self.profiler is not None and self.profiler.recording:
+            self.profiler.count("sprites", sum(1 for sprite in self.allSprites if sprite.dirty and sprite.visible))
+        dirtyRects = self.allSprites.draw(self.screen)
+        if dirtyRects:
+            pygame.display.update(dirtyRects)
+            if self.profiler is not None:
+                self.profiler.count("rects", len(dirtyRects))
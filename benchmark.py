@@ -0,0 +1,281 @@
+#! /usr/bin/python3
+
+import argparse
+import functools
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+import GameModel
+from GameLayout import BoardLayout
+from GameMCTS import MonteCarloTreeSearch
+from GameSearch import SearchEngine
+from GameTransposition import TranspositionTable
+
+
+def new_model(layoutName: str = None) -> GameModel.GameModel:
+    return GameModel.GameModel(BoardLayout.load(layoutName) if layoutName else None)
+
+
+def random_line(seed: int, plies: int, layoutName: str = None) -> list:
+    # positions of a random game that never steps on a throne, so that it can be replayed without EndGame
+    gameModel = new_model(layoutName)
+    rng = random.Random(seed)
+    thrones = (gameModel.player1ThronePos, gameModel.player2ThronePos)
+    line = []
+    for ply in range(plies):
+        moves = [move for move in gameModel.legal_moves(gameModel.activePlayer.color) if move[1] not in thrones]
+        if not moves:
+            break
+        move = rng.choice(moves)
+        gameModel.move_ball(*move)
+        gameModel.change_player()
+        line.append(move)
+    return line
+
+
+def midgame_model(seed: int = 0, plies: int = 40, layoutName: str = None) -> GameModel.GameModel:
+    gameModel = new_model(layoutName)
+    for move in random_line(seed, plies, layoutName):
+        gameModel.move_ball(*move)
+        gameModel.change_player()
+    return gameModel
+
+
+def bench_valid_move(options) -> tuple:
+    gameModel = midgame_model()
+    positions = gameModel.bitboard.positions
+    valid_move = gameModel.valid_move
+    startTime = time.perf_counter()
+    for startPos in positions:
+        for endPos in positions:
+            valid_move(startPos, endPos)
+    return len(positions) ** 2, time.perf_counter() - startTime
+
+
+def bench_legal_moves(options, layoutName: str = None) -> tuple:
+    gameModel = new_model(layoutName)
+    states = []
+    for move in random_line(1, 60, layoutName):
+        gameModel.move_ball(*move)
+        gameModel.change_player()
+        states.append(gameModel.bitboard.state())
+    bitboard = gameModel.bitboard
+    startTime = time.perf_counter()
+    for state in states:
+        bitboard.set_state(state)
+        for color in (GameModel.GameColor.WHITE, GameModel.GameColor.BLACK):
+            for move in gameModel.legal_moves(color):
+                pass
+    return 2 * len(states), time.perf_counter() - startTime
+
+
+def bench_move_undo(options) -> tuple:
+    line = random_line(2, 200)
+    gameModel = GameModel.GameModel()
+    startTime = time.perf_counter()
+    for move in line:
+        gameModel.move_ball(*move)
+        gameModel.change_player()
+    while gameModel.unmake_move():
+        pass
+    return len(line), time.perf_counter() - startTime
+
+
+def bench_playouts(options, layoutName: str = None) -> tuple:
+    gameModel = midgame_model(layoutName=layoutName)
+    engine = MonteCarloTreeSearch(gameModel.bitboard, gameModel.throne_cells(), seed=0)
+    bitboard = gameModel.bitboard
+    state = bitboard.state()
+    color = gameModel.activePlayer.color.value
+    playouts = 200
+    startTime = time.perf_counter()
+    for playout in range(playouts):
+        engine.rollout(color)
+        bitboard.set_state(state)
+    return playouts, time.perf_counter() - startTime
+
+
+def bench_batch_playouts(options) -> tuple:
+    import numpy as np
+    from GameBatch import BatchGameModel
+    games = 256
+    batch = BatchGameModel(games, midgame_model())
+    generator = np.random.default_rng(0)
+    startTime = time.perf_counter()
+    batch.rollout(generator, 100)
+    return games, time.perf_counter() - startTime
+
+
+def bench_search(options, layoutName: str = None) -> tuple:
+    gameModel = midgame_model(layoutName=layoutName)
+    engine = SearchEngine(gameModel.bitboard, gameModel.throne_cells(), timeBudget=3600, maxDepth=options.depth,
+                          table=TranspositionTable(16))
+    engine.search(gameModel.activePlayer.color.value)
+    return engine.nodes, engine.elapsed
+
+
+def bench_parallel_search(options) -> tuple:
+    from GameParallelSearch import ParallelSearch
+    gameModel = midgame_model()
+    engine = ParallelSearch(gameModel.bitboard, gameModel.throne_cells(), timeBudget=3600, maxDepth=1,
+                            workers=options.workers)
+    try:
+        # the first search starts the worker processes, it is not timed
+        engine.search(gameModel.activePlayer.color.value)
+        engine.engine.maxDepth = options.depth
+        engine.search(gameModel.activePlayer.color.value)
+    finally:
+        engine.close()
+    return engine.nodes, engine.elapsed
+
+
+def view_init(layoutName: str = None):
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    import pygame
+    pygame.init()
+    from GameMenu import GameMenu
+    from GameView import GameView
+    from GameController import Gauntlet
+    gameMenu = GameMenu()
+    gameView = GameView(gameMenu.screen, midgame_model(layoutName=layoutName))
+    gameView.gauntlet = Gauntlet()
+    gameView.init_draw()
+    return gameView
+
+
+def bench_view_idle(options) -> tuple:
+    gameView = view_init()
+    frames = 500
+    startTime = time.perf_counter()
+    for frame in range(frames):
+        gameView.view_update()
+    return frames, time.perf_counter() - startTime
+
+
+def bench_view_move(options, layoutName: str = None) -> tuple:
+    # a move and its undo, each followed by a frame
+    gameView = view_init(layoutName)
+    gameModel = gameView.gameModel
+    moves = list(gameModel.legal_moves(gameModel.activePlayer.color))
+    thrones = (gameModel.player1ThronePos, gameModel.player2ThronePos)
+    moves = [move for move in moves if move[1] not in thrones]
+    rng = random.Random(0)
+    frames = 0
+    startTime = time.perf_counter()
+    for i in range(250):
+        gameModel.move_ball(*rng.choice(moves))
+        gameView.view_update()
+        gameModel.unmake_move()
+        gameView.view_update()
+        frames += 2
+    return frames, time.perf_counter() - startTime
+
+
+# name -> (function returning (operations, seconds) of one run, what an operation is)
+benchmarks = {
+    "valid_move": (bench_valid_move, "valid_move calls over all from/to pairs"),
+    "legal_moves": (bench_legal_moves, "full legal move enumerations"),
+    "move_undo": (bench_move_undo, "move_ball + change_player + unmake_move"),
+    "playouts": (bench_playouts, "random playouts of the MCTS engine"),
+    "batch_playouts": (bench_batch_playouts, "games of a 100 ply BatchGameModel rollout"),
+    "search": (bench_search, "alpha-beta search nodes"),
+    "parallel_search": (bench_parallel_search, "alpha-beta search nodes with --workers processes"),
+    "view_idle": (bench_view_idle, "GameView.view_update frames without changes"),
+    "view_move": (bench_view_move, "GameView.view_update frames after a move or an undo"),
+}
+# the same on the larger boards of resources/layouts
+for layoutName in ("large25", "large31"):
+    for name in ("legal_moves", "playouts", "search", "view_move"):
+        function, operation = benchmarks[name]
+        benchmarks["{}_{}".format(name, layoutName[-2:])] = (functools.partial(function, layoutName=layoutName),
+                                                             "{} on {}".format(operation, layoutName))
+
+
+def run_benchmark(name: str, options) -> dict:
+    function = benchmarks[name][0]
+    rates = []
+    for run in range(options.repeat):
+        operations, seconds = function(options)
+        rates.append(operations / seconds)
+    best = max(rates)
+    return {"unit": "ops/s", "value": best, "timePerOp": 1 / best, "runs": rates, "operation": benchmarks[name][1]}
+
+
+def machine_info() -> dict:
+    info = {"python": platform.python_version(), "implementation": platform.python_implementation(),
+            "system": platform.platform(), "machine": platform.machine(), "cpus": os.cpu_count()}
+    for module in ("numpy", "pygame"):
+        if module in sys.modules:
+            info[module] = sys.modules[module].__version__
+    return info
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    # names of the benchmarks slower than the baseline by more than tolerance; higher values are better
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        change = result["value"] / baseline[name]["value"] - 1
+        result["baseline"] = baseline[name]["value"]
+        result["change"] = change
+        if change < -tolerance:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the game's hot paths and compare them to a baseline.")
+    parser.add_argument("names", nargs="*", help="benchmarks to run, all by default: " + ", ".join(benchmarks))
+    parser.add_argument("-o", "--output", default="-", help="JSON file, - for standard output")
+    parser.add_argument("-b", "--baseline", help="JSON file of an earlier run to compare with")
+    parser.add_argument("-t", "--tolerance", type=float, default=0.1, help="allowed slowdown against the baseline")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="runs per benchmark, the best one counts")
+    parser.add_argument("--depth", type=int, default=3, help="depth of the search benchmarks")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count(), help="processes of parallel_search")
+    args = parser.parse_args()
+
+    names = args.names or list(benchmarks)
+    for name in names:
+        if name not in benchmarks:
+            parser.error("unknown benchmark {}, expected one of {}".format(name, ", ".join(benchmarks)))
+    if args.workers < 2 and "parallel_search" in names:
+        if args.names:
+            parser.error("parallel_search needs at least 2 workers")
+        names.remove("parallel_search")
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)["results"]
+
+    results = {}
+    for name in names:
+        results[name] = run_benchmark(name, args)
+    regressions = compare(results, baseline, args.tolerance) if baseline is not None else []
+
+    for name, result in results.items():
+        line = "{:16} {:>12.0f} ops/s {:>10.2f}us".format(name, result["value"], result["timePerOp"] * 1e6)
+        if "change" in result:
+            line += " {:+7.1%}{}".format(result["change"], " REGRESSION" if name in regressions else "")
+        print(line, file=sys.stderr)
+
+    report = {"date": time.strftime("%Y-%m-%dT%H:%M:%S"), "machine": machine_info(), "options": vars(args),
+              "results": results, "regressions": regressions}
+    if args.output == "-":
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+    if regressions:
+        print("Slower than the baseline: {}".format(", ".join(regressions)), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
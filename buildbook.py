@@ -0,0 +1,172 @@
+#! /usr/bin/python3
+
+import argparse
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import GameModel
+from GameBook import OpeningBook
+from GameLayout import BoardLayout, BoardLayoutError
+from GameSearch import SearchEngine
+from GameTransposition import TranspositionTable
+
+# layout name -> (model, initial state, initial color), one per worker process
+workerModels = {}
+
+
+def worker_model(layoutName: str) -> tuple:
+    if layoutName not in workerModels:
+        gameModel = GameModel.GameModel(BoardLayout.load(layoutName))
+        workerModels[layoutName] = gameModel, gameModel.bitboard.state(), gameModel.activePlayer.color
+    return workerModels[layoutName]
+
+
+def new_engine(gameModel: GameModel.GameModel, depth: int, tableMegabytes: float) -> SearchEngine:
+    # depth bounds the search, not the clock
+    return SearchEngine(gameModel.bitboard, gameModel.throne_cells(), timeBudget=3600, maxDepth=depth,
+                        table=TranspositionTable(tableMegabytes))
+
+
+def entry_of(engine: SearchEngine, move: tuple, numOfBits: int) -> tuple:
+    # (move, score, depth, kind) as stored in the book
+    if engine.score >= engine.winScore - engine.maxDepth:
+        # the winning move onto the throne is played at ply winScore - score, every second ply is ours
+        return move[0] * numOfBits + move[1], engine.score, (engine.winScore - engine.score) // 2 + 1, OpeningBook.WIN
+    return move[0] * numOfBits + move[1], engine.score, engine.depth, OpeningBook.BOOK
+
+
+def analyse_position(task: tuple) -> tuple:
+    # searches the position after history, returns its hash, book entry, the moves to expand and the nodes searched
+    layoutName, history, depth, width, tableMegabytes = task
+    gameModel, state, color = worker_model(layoutName)
+    bitboard = gameModel.bitboard
+    bitboard.set_state(state)
+    for start, end in history:
+        bitboard.move(color, start, end)
+        color = 1 - color
+    key = bitboard.position_hash(color)
+    engine = new_engine(gameModel, depth, tableMegabytes)
+    move = engine.search(color)
+    if move is None:
+        return key, None, [], engine.nodes
+    entry = entry_of(engine, move, bitboard.numOfBits)
+    children = []
+    if entry[3] == OpeningBook.BOOK:
+        thrones = engine.thrones
+        for candidate in engine.ordered_moves(color, move):
+            # a move onto a throne ends the game, there is nothing to expand
+            if candidate[1] not in thrones:
+                children.append(candidate)
+            if len(children) == width:
+                break
+    return key, entry, children, engine.nodes
+
+
+def sample_wins(task: tuple) -> tuple:
+    # plays a random game and proves forced wins in positions where the side to move is near the throne;
+    # returns the (hash, entry) pairs found, the positions tried and the nodes searched
+    layoutName, seed, plies, radius, winDepth, tableMegabytes = task
+    gameModel, state, color = worker_model(layoutName)
+    bitboard = gameModel.bitboard
+    bitboard.set_state(state)
+    engine = new_engine(gameModel, 2 * winDepth - 1, tableMegabytes)
+    distances = engine.distances
+    thrones = engine.thrones
+    rng = random.Random(seed)
+    found = []
+    tried = 0
+    nodes = 0
+    for ply in range(plies):
+        stones = bitboard.stones[color]
+        near = False
+        while stones and not near:
+            bit = stones & -stones
+            stones ^= bit
+            near = distances[color][bit.bit_length() - 1] <= radius
+        if near:
+            tried += 1
+            move = engine.search(color)
+            nodes += engine.nodes
+            if move is not None and engine.score >= engine.winScore - engine.maxDepth:
+                found.append((bitboard.position_hash(color), entry_of(engine, move, bitboard.numOfBits)))
+        moves = [move for move in bitboard.legal_moves(color) if move[1] not in thrones]
+        if not moves:
+            break
+        bitboard.move(color, *rng.choice(moves))
+        color = 1 - color
+    return found, tried, nodes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the opening book and the win-in-N cache of a board.")
+    parser.add_argument("--layout", default=GameModel.GameModel.layoutName,
+                        help="board from resources/layouts or a layout file: " + ", ".join(BoardLayout.available()))
+    parser.add_argument("-o", "--output", help="book file, resources/books/<layout>.book by default")
+    parser.add_argument("--plies", type=int, default=4, help="depth of the book tree from the initial position")
+    parser.add_argument("--width", type=int, default=3, help="moves expanded in every book position")
+    parser.add_argument("--depth", type=int, default=4, help="search depth of the book positions")
+    parser.add_argument("--samples", type=int, default=200, help="random games searched for forced wins")
+    parser.add_argument("--sample-plies", type=int, default=120)
+    parser.add_argument("--radius", type=int, default=4,
+                        help="distance of the nearest stone to the throne that makes a position worth proving")
+    parser.add_argument("--win-depth", type=int, default=2, help="wins in up to this many moves are proven")
+    parser.add_argument("--table", type=float, default=16, help="transposition table megabytes per worker")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    try:
+        layout = BoardLayout.load(args.layout)
+    except BoardLayoutError as error:
+        parser.error(str(error))
+    output = args.output or OpeningBook.book_path(layout)
+    entries = {}
+    nodes = 0
+    startTime = time.perf_counter()
+
+    with ProcessPoolExecutor(args.workers) as executor:
+        level = [[]]
+        seen = set()
+        for ply in range(args.plies + 1):
+            width = args.width if ply < args.plies else 0
+            tasks = [(args.layout, history, args.depth, width, args.table) for history in level]
+            nextLevel = []
+            for history, (key, entry, children, searched) in zip(level, executor.map(analyse_position, tasks)):
+                nodes += searched
+                if entry is None or key in seen:
+                    continue
+                seen.add(key)
+                entries[key] = entry
+                nextLevel.extend(history + [child] for child in children)
+            level = nextLevel
+            elapsed = time.perf_counter() - startTime
+            print("ply {}: {} positions, {:.1f}s, {:.0f} nodes/s".format(ply, len(entries), elapsed, nodes / elapsed),
+                  file=sys.stderr)
+        bookPositions = len(entries)
+
+        tasks = [(args.layout, args.seed + i, args.sample_plies, args.radius, args.win_depth, args.table)
+                 for i in range(args.samples)]
+        tried = 0
+        wins = 0
+        for found, sampleTried, searched in executor.map(sample_wins, tasks, chunksize=4):
+            tried += sampleTried
+            nodes += searched
+            for key, entry in found:
+                previous = entries.get(key)
+                if previous is None or previous[3] == OpeningBook.BOOK:
+                    entries[key] = entry
+                    wins += 1
+
+    OpeningBook.write(output, OpeningBook.layout_key(layout.bitboard_layout()), entries)
+    elapsed = time.perf_counter() - startTime
+    print("{} positions ({} book, {} wins of {} tried) in {:.1f}s with {} workers: {:.1f} positions/s, {:.0f} nodes/s, "
+          "{} bytes written to {}".format(len(entries), bookPositions, wins, tried, elapsed, args.workers,
+                                          (bookPositions + tried) / elapsed, nodes / elapsed,
+                                          os.path.getsize(output), output), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
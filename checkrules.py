@@ -0,0 +1,259 @@
+#! /usr/bin/python3
+
+import argparse
+import random
+import sys
+
+import numpy as np
+
+import GameModel
+from GameBatch import BatchGameModel
+from GameLayout import BoardLayout
+from GameThreats import ThreatMap
+
+
+class RuleMismatch(Exception):
+    pass
+
+
+def new_model(layoutName: str) -> GameModel.GameModel:
+    return GameModel.GameModel(BoardLayout.load(layoutName))
+
+
+def reference_valid_move(gameModel: GameModel.GameModel, balls: dict, color, startPos: tuple, endPos: tuple) -> bool:
+    # the rules as the game first had them, walking the cells between start and end;
+    # balls maps positions to colours and is kept by the caller, independently of the model
+    (startRow, startColumn), (endRow, endColumn) = startPos, endPos
+    if (startRow == endRow) == (startColumn == endColumn):
+        return False
+    if startRow == endRow:
+        between = [(startRow, column) for column in range(min(startColumn, endColumn) + 1, max(startColumn, endColumn))]
+    else:
+        between = [(row, startColumn) for row in range(min(startRow, endRow) + 1, max(startRow, endRow))]
+    walls = gameModel.wallsMap
+    startWall = bool(walls[startPos])
+    if startWall != bool(walls[endPos]):
+        # stepping between the ground and a wall only goes to the adjacent cell
+        if between:
+            return False
+    elif any(bool(walls[position]) != startWall for position in between):
+        return False
+    if any(position in balls for position in between):
+        return False
+    if balls.get(endPos) == color:
+        return False
+    thrones = (gameModel.player1ThronePos, gameModel.player2ThronePos)
+    return not any(position in thrones for position in between)
+
+
+def random_move(gameModel: GameModel.GameModel, rng: random.Random, moves: list):
+    # never onto a throne, a game reaching one would end before the plies are played
+    thrones = (gameModel.player1ThronePos, gameModel.player2ThronePos)
+    moves = [move for move in moves if move[1] not in thrones]
+    return rng.choice(moves) if moves else None
+
+
+def check_rules(args) -> str:
+    # Bitboard.valid_move and legal_moves against reference_valid_move, move_ball against a reference board
+    rng = random.Random(args.seed)
+    comparisons = 0
+    for game in range(args.games):
+        gameModel = new_model(args.layout)
+        positions = gameModel.bitboard.positions
+        balls = {}
+        for player in (gameModel.player1, gameModel.player2):
+            for cell in player.balls:
+                balls[positions[cell]] = player.color
+        for ply in range(args.plies):
+            color = gameModel.activePlayer.color
+            reference = {(startPos, endPos) for startPos, ballColor in balls.items() if ballColor == color
+                         for endPos in positions if reference_valid_move(gameModel, balls, color, startPos, endPos)}
+            legal = set(gameModel.legal_moves(color))
+            if legal != reference:
+                raise RuleMismatch("game {} ply {}: legal moves differ by {}".format(game, ply, sorted(legal ^ reference)))
+            for startPos in rng.sample(positions, args.samples):
+                for endPos in positions:
+                    if gameModel.valid_move(startPos, endPos) != reference_valid_move(gameModel, balls, color,
+                                                                                       startPos, endPos):
+                        raise RuleMismatch("game {} ply {}: valid_move{} differs".format(game, ply, (startPos, endPos)))
+            comparisons += len(reference) + args.samples * len(positions)
+            move = random_move(gameModel, rng, sorted(reference))
+            if move is None:
+                break
+            if not gameModel.move_ball(*move):
+                raise RuleMismatch("game {} ply {}: move_ball{} refused".format(game, ply, move))
+            balls[move[1]] = balls.pop(move[0])
+            modelBalls = {positions[cell]: player.color for player in (gameModel.player1, gameModel.player2)
+                          for cell in player.balls}
+            if modelBalls != balls or any(gameModel.color_at(position) != ballColor
+                                          for position, ballColor in balls.items()):
+                raise RuleMismatch("game {} ply {}: boards differ after {}".format(game, ply, move))
+            gameModel.change_player()
+    return "{} comparisons".format(comparisons)
+
+
+def batch_board(gameModel: GameModel.GameModel) -> np.ndarray:
+    # the board of a GameModel in the BatchGameModel encoding
+    board = np.zeros(gameModel.bitboard.numOfBits, dtype=np.uint8)
+    for player in (gameModel.player1, gameModel.player2):
+        board[list(player.balls)] = player.color + 1
+    return board.reshape(gameModel.numOfCells, gameModel.numOfCells)
+
+
+def check_batch(args) -> str:
+    # BatchGameModel legal moves and moves against GameModel, all games played side by side
+    rng = random.Random(args.seed)
+    gameModels = [new_model(args.layout) for game in range(args.games)]
+    batch = BatchGameModel(args.games, gameModels[0])
+    finished = [False] * args.games
+    winners = [-1] * args.games
+    comparisons = 0
+    for ply in range(args.plies):
+        masks = batch.legal_masks().reshape(args.games, -1)
+        moves = np.full(args.games, -1)
+        for game, gameModel in enumerate(gameModels):
+            legal = set(gameModel.legal_moves(gameModel.activePlayer.color)) if not finished[game] else set()
+            batchMoves = {batch.decode_move(move) for move in np.nonzero(masks[game])[0]}
+            if legal != batchMoves:
+                raise RuleMismatch("game {} ply {}: legal moves differ by {}".format(game, ply,
+                                                                                     sorted(legal ^ batchMoves)))
+            comparisons += len(legal)
+            if not finished[game]:
+                move = rng.choice(sorted(legal)) if legal else None
+                if move is None:
+                    finished[game] = True
+                    continue
+                moves[game] = batch.encode_move(*move)
+                try:
+                    gameModel.move_ball(*move)
+                    gameModel.change_player()
+                except GameModel.EndGame:
+                    finished[game] = True
+                    winners[game] = gameModel.activePlayer.color
+        batch.apply_moves(moves)
+        for game, gameModel in enumerate(gameModels):
+            if not (batch_board(gameModel) == batch.board[game]).all():
+                raise RuleMismatch("game {} ply {}: boards differ".format(game, ply))
+            if batch.winners[game] != winners[game]:
+                raise RuleMismatch("game {} ply {}: winner differs".format(game, ply))
+        if all(finished):
+            break
+    return "{} comparisons, {} games won".format(comparisons, int((batch.winners >= 0).sum()))
+
+
+def compare_threats(threats: ThreatMap, gameModel: GameModel.GameModel, where: str) -> int:
+    # returns the number of sides that have to answer a throne threat
+    bitboard = gameModel.bitboard
+    thrones = threats.thrones
+    threatened = 0
+    for color in (0, 1):
+        legal = sorted(bitboard.legal_moves(color))
+        if sorted(threats.legal_moves(color)) != legal:
+            raise RuleMismatch("{}: threat map moves differ".format(where))
+        reaching = 0
+        for start, end in legal:
+            if end == thrones[color]:
+                reaching |= 1 << start
+        attacks = 0
+        for start, end in bitboard.legal_moves(1 - color):
+            attacks |= 1 << end
+        if threats.throne_threats(color) != reaching or threats.en_prise(color) != bitboard.stones[color] & attacks:
+            raise RuleMismatch("{}: throne threats or captures differ".format(where))
+        defences = threats.defences(color)
+        threatened += defences >= 0
+        for start, end in legal:
+            if defences >= 0 and not defences >> end & 1:
+                # a move off the defence cells has to leave a throne threat standing
+                captured = bitboard.move(color, start, end)
+                standing = any(reply[1] == thrones[1 - color] for reply in bitboard.legal_moves(1 - color))
+                bitboard.unmake(color, start, end, captured)
+                if not standing:
+                    raise RuleMismatch("{}: move {} defends but is not among the defences".format(where, (start, end)))
+    return threatened
+
+
+def check_threats(args) -> str:
+    # ThreatMap kept along a game with touch() and through searches with push()/pop() against Bitboard
+    rng = random.Random(args.seed)
+    positions = 0
+    threatened = 0
+    for game in range(args.games):
+        gameModel = new_model(args.layout)
+        bitboard = gameModel.bitboard
+        threats = ThreatMap(bitboard, gameModel.throne_cells())
+        for ply in range(args.plies):
+            color = gameModel.activePlayer.color
+            move = random_move(gameModel, rng, list(gameModel.legal_moves(color)))
+            if move is None:
+                break
+            gameModel.move_ball(*move)
+            threats.touch(bitboard.cell(move[0]), bitboard.cell(move[1]))
+            gameModel.change_player()
+            threatened += compare_threats(threats, gameModel, "game {} ply {}".format(game, ply))
+            color = gameModel.activePlayer.color
+            moves = list(bitboard.legal_moves(color))
+            for start, end in rng.sample(moves, min(2, len(moves))):
+                captured = bitboard.move(color, start, end)
+                threats.push(start, end)
+                threatened += compare_threats(threats, gameModel, "game {} ply {} after {}".format(game, ply,
+                                                                                                   (start, end)))
+                bitboard.unmake(color, start, end, captured)
+                threats.pop()
+                positions += 1
+            positions += 1
+
+    # a threat that can be answered is rare in random games, random stones around the thrones make more of them
+    gameModel = new_model(args.layout)
+    bitboard = gameModel.bitboard
+    thrones = gameModel.throne_cells()
+    threats = ThreatMap(bitboard, thrones)
+    free = [cell for cell in range(bitboard.numOfBits) if cell not in thrones]
+    lines = threats.lines[thrones[0]] | threats.lines[thrones[1]]
+    near = [cell for cell in free if lines >> cell & 1]
+    for board in range(args.boards):
+        bitboard.set_state((0, 0, 0))
+        cells = set(rng.sample(near, min(args.stones // 2, len(near)))) | set(rng.sample(free, args.stones // 2))
+        for i, cell in enumerate(cells):
+            bitboard.place(i % 2, cell)
+        threats.reset()
+        threatened += compare_threats(threats, gameModel, "board {}".format(board))
+        positions += 1
+    return "{} positions, {} throne threats".format(positions, threatened)
+
+
+checks = {
+    "rules": check_rules,
+    "batch": check_batch,
+    "threats": check_threats,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the move generators against each other over random games.")
+    parser.add_argument("names", nargs="*", help="checks to run, all by default: " + ", ".join(checks))
+    parser.add_argument("--layout", default=GameModel.GameModel.layoutName,
+                        help="board from resources/layouts or a layout file: " + ", ".join(BoardLayout.available()))
+    parser.add_argument("--games", type=int, default=8)
+    parser.add_argument("--plies", type=int, default=80)
+    parser.add_argument("--samples", type=int, default=4, help="start cells per position checked against every cell")
+    parser.add_argument("--boards", type=int, default=1000, help="random boards of the threats check")
+    parser.add_argument("--stones", type=int, default=16, help="stones on a random board")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    names = args.names or list(checks)
+    for name in names:
+        if name not in checks:
+            parser.error("unknown check {}, expected one of {}".format(name, ", ".join(checks)))
+    failed = False
+    for name in names:
+        try:
+            print("{}: ok, {}".format(name, checks[name](args)))
+        except RuleMismatch as error:
+            print("{}: FAILED, {}".format(name, error))
+            failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
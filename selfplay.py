@@ -0,0 +1,116 @@
+#! /usr/bin/python3
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import GameModel
+import GameAgents
+from GameArchive import GameArchive
+from GameLayout import BoardLayout, BoardLayoutError
+
+
+def play_game(gameIndex: int, whiteSpec: str, blackSpec: str, seed: int, maxPlies: int, layoutName: str) -> dict:
+    gameModel = GameModel.GameModel(BoardLayout.load(layoutName))
+    specs = {GameModel.GameColor.WHITE: whiteSpec, GameModel.GameColor.BLACK: blackSpec}
+    agents = {color: GameAgents.create_agent(spec, gameModel, seed * 2 + color.value)
+              for color, spec in specs.items()}
+    positions = gameModel.bitboard.positions
+    moves = []
+    moveTimes = []
+    winner = None
+    reason = "max-plies"
+    while len(moves) < maxPlies:
+        color = gameModel.activePlayer.color
+        startTime = time.perf_counter()
+        move = agents[color].choose_move()
+        moveTimes.append(round((time.perf_counter() - startTime) * 1000, 3))
+        if move is None:
+            reason = "no-moves"
+            break
+        startPos, endPos = positions[move[0]], positions[move[1]]
+        moves.append([*startPos, *endPos])
+        try:
+            gameModel.move_ball(startPos, endPos)
+        except GameModel.EndGame:
+            winner = color.name.lower()
+            reason = "throne"
+            break
+        gameModel.change_player()
+    return {"game": gameIndex, "layout": layoutName, "white": whiteSpec, "black": blackSpec, "seed": seed,
+            "winner": winner, "reason": reason, "plies": len(moves), "moves": moves, "moveTimes": moveTimes}
+
+
+def archive_game(game: dict) -> tuple:
+    numOfCells = BoardLayout.load(game["layout"]).numOfCells
+    history = [(y1 * numOfCells + x1, y2 * numOfCells + x2) for y1, x1, y2, x2 in game["moves"]]
+    winner = GameModel.GameColor[game["winner"].upper()].value if game["winner"] else -1
+    return history, winner
+
+
+def play_games(arguments):
+    return [play_game(*gameArguments) for gameArguments in arguments]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play Castle games between computer agents without a display.")
+    parser.add_argument("-n", "--games", type=int, default=100)
+    parser.add_argument("--white", default="random", help="agent spec: random, greedy, search:<depth> or mcts:<iterations>")
+    parser.add_argument("--black", default="random", help="agent spec: random, greedy, search:<depth> or mcts:<iterations>")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count())
+    parser.add_argument("-o", "--output", default="-", help="JSONL file, - for standard output")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-plies", type=int, default=300)
+    parser.add_argument("--batch", type=int, default=16, help="games sent to a worker at once")
+    parser.add_argument("--archive", help="also index the games in this game archive")
+    parser.add_argument("--layout", default=GameModel.GameModel.layoutName,
+                        help="board from resources/layouts or a layout file: " + ", ".join(BoardLayout.available()))
+    args = parser.parse_args()
+
+    try:
+        layout = BoardLayout.load(args.layout)
+    except BoardLayoutError as error:
+        parser.error(str(error))
+    for spec in (args.white, args.black):
+        try:
+            GameAgents.create_agent(spec, GameModel.GameModel(layout))
+        except (ValueError, TypeError) as error:
+            parser.error("invalid agent {}: {}".format(spec, error))
+
+    gameArguments = [(i, args.white, args.black, args.seed + i, args.max_plies, args.layout) for i in range(args.games)]
+    batches = [gameArguments[i:i + args.batch] for i in range(0, len(gameArguments), args.batch)]
+    output = sys.stdout if args.output == "-" else open(args.output, "w")
+    archive = GameArchive(args.archive, layout) if args.archive else None
+    wins = {"white": 0, "black": 0, None: 0}
+
+    def write_batch(batch):
+        for game in batch:
+            output.write(json.dumps(game) + "\n")
+            wins[game["winner"]] += 1
+        if archive is not None:
+            archive.add_games(archive_game(game) for game in batch)
+
+    startTime = time.perf_counter()
+    try:
+        if args.workers > 1:
+            with ProcessPoolExecutor(args.workers) as executor:
+                for batch in executor.map(play_games, batches):
+                    write_batch(batch)
+        else:
+            for batch in batches:
+                write_batch(play_games(batch))
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        if archive is not None:
+            archive.close()
+    elapsed = time.perf_counter() - startTime
+    print("{} games in {:.1f}s ({:.0f} games/min): white {} black {} undecided {}".format(
+        args.games, elapsed, args.games / elapsed * 60, wins["white"], wins["black"], wins[None]), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,21 @@
 #! /usr/bin/python3
 
+import time
+startupSteps = [("start", time.perf_counter())]
+
 import pygame
-import GameView
 import GameController
 import GameMenu
-import GameModel
 
 if __name__ == "__main__":
+    startupSteps.append(("imports", time.perf_counter()))
     pygame.mixer.pre_init(44100, -16, 2, 4096)
     pygame.mixer.init()
     pygame.init()
-    gameModel = GameModel.GameModel()
+    startupSteps.append(("pygame init", time.perf_counter()))
     gameMenu = GameMenu.GameMenu()
-    gameView = GameView.GameView(gameMenu.screen, gameModel)
-    gameController = GameController.GameController(gameView, gameMenu)
+    startupSteps.append(("menu", time.perf_counter()))
+    # the game view and model are built behind the menu, see GameController.game_view
+    gameController = GameController.GameController(None, gameMenu, startupSteps)
+    startupSteps.append(("controller", time.perf_counter()))
     gameController.main_menu()